@@ -39,8 +39,12 @@ YEAR_OPTIONS = ["2026", "2025"]
 # ==================================================
 MAX_VENUES = 3
 
+if "race_results" not in st.session_state:
+    st.session_state.race_results = []
 if "combined_output" not in st.session_state:
     st.session_state.combined_output = ""
+if "result_idx" not in st.session_state:
+    st.session_state.result_idx = 0
 
 # 各会場の設定保存用State初期化
 for v_idx in range(MAX_VENUES):
@@ -66,6 +70,13 @@ for v_idx in range(MAX_VENUES):
         if rk not in st.session_state:
             st.session_state[rk] = False
 
+# 事前取得スケジューラ（プロセスで1つだけ起動）
+warmup = keiba_bot.get_warmup_scheduler()
+if warmup.calendar and warmup.times:
+    last_run = warmup.last_run_at.strftime("%H:%M") if warmup.last_run_at else "未実行"
+    st.sidebar.caption(f"🔥 事前取得：{len(warmup.calendar)}開催 / 最終実行 {last_run}")
+    if warmup.last_error: st.sidebar.caption(f"⚠️ 事前取得エラー: {warmup.last_error}")
+
 # ==================================================
 # Helper Functions
 # ==================================================
@@ -82,6 +93,16 @@ def set_preset(v_idx, mode):
         elif mode == "7-12":
             st.session_state[key] = (r >= 7)
 
+def move_result(step):
+    n = len(st.session_state["race_results"])
+    if n: st.session_state["result_idx"] = (st.session_state["result_idx"] + step) % n
+
+def store_results(results):
+    st.session_state["race_results"] = results
+    st.session_state["result_idx"] = 0
+    # 全文は結果確定時に1度だけ組み立てる（ダウンロード用）。メモリ上限モードでは要求時に組み立てる
+    st.session_state["combined_output"] = "" if keiba_bot.MEMORY_BOUNDED else keiba_bot.combine_outputs(results)
+
 # ==================================================
 # Main UI
 # ==================================================
@@ -170,26 +191,51 @@ col_btn1, col_btn2 = st.columns(2)
 
 # 1. AI予想モード
 if col_btn1.button("AI予想を開始する", type="primary", disabled=btn_disabled):
-    st.session_state["combined_output"] = ""
+    store_results([])
     # mode="ai" を指定してDify経由の予想を実行
-    result_text = keiba_bot.run_batch_prediction(jobs_config, mode="ai")
-    st.session_state["combined_output"] = result_text
+    store_results(keiba_bot.run_batch_prediction(jobs_config, mode="ai"))
 
 # 2. 情報取得モード（Difyなし・対戦表なし）
 if col_btn2.button("情報を取得する（Difyなし・対戦表なし）", disabled=btn_disabled):
-    st.session_state["combined_output"] = ""
+    store_results([])
     # mode="info" を指定して生データのみ取得
-    result_text = keiba_bot.run_batch_prediction(jobs_config, mode="info")
-    st.session_state["combined_output"] = result_text
+    store_results(keiba_bot.run_batch_prediction(jobs_config, mode="info"))
 
 # ==================================================
 # Output Area
 # ==================================================
-if st.session_state["combined_output"]:
+# 1レースずつ表示し、コピーボタン(iframe)は表示中レースの1つだけにする
+results = st.session_state["race_results"]
+if results:
     st.divider()
     st.subheader("📌 統合出力結果")
-    st.text_area(
-        "全開催・全レースまとめ",
-        value=st.session_state["combined_output"],
-        height=600
-    )
+
+    labels = [f"{x['place_name']} {x['race_num']}R" + (" ⚠️" if x["error"] else "") for x in results]
+    nav1, nav2, nav3 = st.columns([1, 4, 1])
+    nav1.button("◀ 前", on_click=move_result, args=(-1,), key="btn_prev_result")
+    nav2.selectbox("表示レース", range(len(results)), format_func=lambda i: labels[i], key="result_idx", label_visibility="collapsed")
+    nav3.button("次 ▶", on_click=move_result, args=(1,), key="btn_next_result")
+
+    cur = results[st.session_state["result_idx"]]
+    if cur["error"]:
+        st.error(cur["error"])
+    else:
+        cur_output = keiba_bot.load_output(cur)
+        keiba_bot.render_copy_button(cur_output, f"{labels[st.session_state['result_idx']]}をコピー", "cp_current")
+        with st.expander(cur["race_title"] or labels[st.session_state["result_idx"]], expanded=True):
+            # 情報取得モードは生データ（Markdownではない）なので改行を保ったまま表示
+            if cur.get("mode") == "info":
+                st.text_area("データ", cur_output, height=400, key=f"info_{cur['race_id']}", label_visibility="collapsed")
+            else:
+                st.markdown(cur_output)
+
+    if not st.session_state["combined_output"]:
+        if st.button("全開催・全レースまとめを準備する", key="btn_prepare_all"):
+            st.session_state["combined_output"] = keiba_bot.combine_outputs(results)
+    if st.session_state["combined_output"]:
+        st.download_button(
+            "全開催・全レースまとめをダウンロード",
+            data=st.session_state["combined_output"],
+            file_name="umai_output.txt",
+            mime="text/plain",
+        )
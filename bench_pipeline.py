@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+
+from mock_site import MockConfig, start_mock_site
+from rss_monitor import PeakRssMonitor
+
+# ==================================================
+# 模擬サイトに対するエンドツーエンド負荷試験
+# ==================================================
+# 例: python bench_pipeline.py --workers 2 --cards 3 --races 12 --latency-ms 300 --error-rate 0.02
+#     python bench_pipeline.py --workers 1 --tabs 4   （1つのChromeでタブ並列）
+# 本番の共有ジョブキュー/ワーカー(_race_worker)をそのまま使い、
+# races/min・段階別 p50/p95・プロセスツリー(Chrome含む)のピークRSSを出力する。
+
+def percentile(values, pct):
+    if not values: return 0.0
+    vals = sorted(values)
+    k = max(0, min(len(vals) - 1, math.ceil(pct / 100.0 * len(vals)) - 1))
+    return vals[k]
+
+def _configure_env(base_url, args, work_dir):
+    # keiba_bot は import 時に設定を読むため、import より前に環境変数で上書きする
+    os.environ.update({
+        "BASE_URL": base_url,
+        "NETKEIBA_URL": base_url,
+        "YAHOO_URL": base_url,
+        "DIFY_API_URL": f"{base_url}/v1",
+        "DIFY_API_KEY": "mock",
+        "KEIBA_ID": "bench",
+        "KEIBA_PASS": "bench",
+        "CACHE_DIR": os.path.join(work_dir, "cache"),
+        "CACHE_TTL_SEC": json.dumps(args.cache_ttl),
+        "EXPORT_DIR": os.path.join(work_dir, "exports"),
+        "EXPORT_FORMATS": json.dumps(args.export_formats),
+        "BROWSER_TABS": json.dumps(args.tabs),
+    })
+
+def run_bench(args) -> dict:
+    cfg = MockConfig(
+        record_dir=args.record_dir, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, horses=args.horses, dify_ttfb_ms=args.dify_ttfb_ms,
+        dify_chunks=args.dify_chunks, dify_chunk_ms=args.dify_chunk_ms,
+        dify_error_rate=args.dify_error_rate, multiline_sse=args.multiline_sse, seed=args.seed,
+    )
+    server, base_url = start_mock_site(cfg)
+    work_dir = tempfile.mkdtemp(prefix="umai_bench_")
+    _configure_env(base_url, args, work_dir)
+
+    import keiba_bot
+    from job_queue import RaceJobQueue
+
+    jq = RaceJobQueue(keiba_bot._race_worker, num_workers=args.workers, on_idle=keiba_bot._release_driver)
+    with PeakRssMonitor(interval=0.5) as mon:
+        t_start = time.perf_counter()
+        tasks = []
+        for c in range(args.cards):
+            # 開催ごとに日目をずらして別カード扱いにする
+            day = f"{c + 1:02}"
+            for r in range(1, args.races + 1):
+                tasks.append(keiba_bot.submit_race(jq, args.year, "04", "04", day, r, args.mode))
+        for t in tasks: t.done.wait()
+        elapsed = time.perf_counter() - t_start
+        jq.shutdown()
+
+    ok = [t for t in tasks if t.error is None and t.result]
+    stages = {}
+    for t in ok:
+        timings = t.result.get("timings", {})
+        # race_total は process_race が実時間で記録する（タブ並列では段階が重なるため合計しない）
+        for stage, sec in timings.items(): stages.setdefault(stage, []).append(sec)
+
+    server.shutdown()
+    return {
+        "workers": args.workers,
+        "tabs": args.tabs,
+        "mode": args.mode,
+        "races_submitted": len(tasks),
+        "races_ok": len(ok),
+        "races_failed": len(tasks) - len(ok),
+        "elapsed_sec": round(elapsed, 2),
+        "races_per_min": round(len(ok) / elapsed * 60.0, 2) if elapsed > 0 else 0.0,
+        "peak_rss_mb": round(mon.peak_mb, 1),
+        "stages": {
+            k: {"n": len(v), "p50_ms": round(percentile(v, 50) * 1000, 1), "p95_ms": round(percentile(v, 95) * 1000, 1)}
+            for k, v in sorted(stages.items())
+        },
+        "dify": keiba_bot.DIFY_CLIENT.stats(),
+        "page_waits": keiba_bot.PAGE_WAITER.stats(),
+        "mock_requests": dict(cfg.counts),
+    }
+
+def print_report(rep: dict):
+    print(f"workers={rep['workers']} tabs={rep['tabs']} mode={rep['mode']}  races ok/submitted = {rep['races_ok']}/{rep['races_submitted']}")
+    print(f"elapsed {rep['elapsed_sec']}s  →  {rep['races_per_min']} races/min   peak RSS {rep['peak_rss_mb']} MB")
+    print(f"{'stage':<14}{'n':>5}{'p50(ms)':>12}{'p95(ms)':>12}")
+    for stage, st in rep["stages"].items():
+        print(f"{stage:<14}{st['n']:>5}{st['p50_ms']:>12}{st['p95_ms']:>12}")
+    d = rep["dify"]
+    if d["calls"]:
+        fmt = lambda v: "-" if v is None else f"{v * 1000:.0f}ms"
+        print(f"dify: calls={d['calls']} errors={d['errors']} retries={d['retries']} "
+              f"ttfb p50={fmt(d['ttfb_p50_sec'])} p95={fmt(d['ttfb_p95_sec'])}")
+    for host, w in rep["page_waits"].items():
+        print(f"waits {host}: pages={w['pages']} wait={w['wait_sec']:.1f}s ready={w['ready']} "
+              f"nodata={w['nodata']} error={w['error']} timeout={w['timeout']} → timeout now {w['timeout_sec']:.1f}s")
+    print("mock requests:", ", ".join(f"{k}={v}" for k, v in sorted(rep["mock_requests"].items())))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="UMAI パイプライン負荷試験（模擬サイト使用）")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--tabs", type=int, default=1, help="ワーカー1つあたりのChromeタブ数")
+    ap.add_argument("--cards", type=int, default=1, help="開催数")
+    ap.add_argument("--races", type=int, default=12, help="1開催あたりのレース数")
+    ap.add_argument("--year", default="2026")
+    ap.add_argument("--mode", choices=["ai", "info", "prefetch"], default="ai")
+    ap.add_argument("--record-dir", default=None)
+    ap.add_argument("--latency-ms", type=float, default=200)
+    ap.add_argument("--jitter-ms", type=float, default=100)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--horses", type=int, default=16)
+    ap.add_argument("--dify-ttfb-ms", type=float, default=1500)
+    ap.add_argument("--dify-chunks", type=int, default=20)
+    ap.add_argument("--dify-chunk-ms", type=float, default=100)
+    ap.add_argument("--dify-error-rate", type=float, default=0.0)
+    ap.add_argument("--multiline-sse", action="store_true")
+    ap.add_argument("--cache-ttl", type=int, default=0, help="0でキャッシュ無効（毎回取得）")
+    ap.add_argument("--export-formats", nargs="*", default=[])
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = ap.parse_args(argv)
+
+    rep = run_bench(args)
+    if args.json: print(json.dumps(rep, ensure_ascii=False, indent=1))
+    else: print_report(rep)
+    return 0 if rep["races_ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import re
+import sys
+import time
+import random
+import argparse
+
+import text_norm
+
+# ==================================================
+# テキスト正規化のマイクロベンチマーク（cells/sec）
+# ==================================================
+# 例: python bench_text_norm.py --cells 200000
+# 「旧」は text_norm 導入前に各パーサへ直書きされていた処理をそのまま写したもの。
+
+def old_clean_text_ja(s):
+    if not s: return ""
+    s = s.replace("　", " ")
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+def old_safe_int(s, default=0):
+    try:
+        if s is None: return default
+        if isinstance(s, (int, float)): return int(s)
+        ss = str(s).strip()
+        ss = re.sub(r"[^0-9\-]", "", ss)
+        if ss in {"", "-", "－"}: return default
+        return int(ss)
+    except: return default
+
+def old_umaban(txt):
+    return re.sub(r"\D", "", txt)
+
+def old_get_val(txt):
+    return int(re.sub(r"\D", "", txt)) if re.sub(r"\D", "", txt) else 0
+
+def old_rank_key(rank):
+    return int(re.sub(r"\D", "", rank)) if re.sub(r"\D", "", rank) else 999
+
+CASES = [
+    # (名前, 旧, 新, セル生成)
+    ("clean_text", old_clean_text_ja, text_norm.clean_text_ja, "text"),
+    ("umaban", old_umaban, text_norm.digits_only, "umaban"),
+    ("get_val", old_get_val, lambda t: text_norm.digits_to_int(t, 0), "speed"),
+    ("safe_int", old_safe_int, text_norm.safe_int, "speed"),
+    ("rank_key", old_rank_key, lambda t: text_norm.digits_to_int(t, 999), "rank"),
+]
+
+def make_cells(kind, n, rng):
+    if kind == "umaban":
+        pool = [str(i) for i in range(1, 19)] + [f"{i}番" for i in range(1, 19)] + ["１", "１８"]
+    elif kind == "speed":
+        pool = [str(v) for v in range(60, 120)] + ["-", "－", "", " 98 "]
+    elif kind == "rank":
+        pool = [str(i) for i in range(1, 19)] + ["中", "取", "除", "?"]
+    else:
+        pool = [
+            "状態は良好。　前走より上積みがある。",
+            "  道中スムーズ。直線も伸びていた。 ",
+            "動き上々\n併せて先着",
+            "美Ｗ良　67.5-52.3-38.0-11.9",
+        ]
+    return [rng.choice(pool) for _ in range(n)]
+
+def cells_per_sec(fn, cells, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for c in cells: fn(c)
+        best = min(best, time.perf_counter() - t0)
+    return len(cells) / best if best > 0 else float("inf")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="text_norm マイクロベンチマーク")
+    ap.add_argument("--cells", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print(f"{'case':<12}{'old cells/s':>16}{'new cells/s':>16}{'speedup':>10}")
+    for name, old, new, kind in CASES:
+        cells = make_cells(kind, args.cells, rng)
+        # 新旧で結果が一致することを先に確認（全角数字は新実装のみ半角化するので比較は int 値で）
+        for c in set(cells):
+            o, n_ = old(c), new(c)
+            if kind == "umaban": o, n_ = int(o) if o else None, int(n_) if n_ else None
+            if o != n_:
+                print(f"mismatch in {name}: {c!r} old={o!r} new={n_!r}")
+                return 1
+        old_cps = cells_per_sec(old, cells, args.repeat)
+        new_cps = cells_per_sec(new, cells, args.repeat)
+        print(f"{name:<12}{old_cps:>16,.0f}{new_cps:>16,.0f}{new_cps / old_cps:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ==================================================
+# 1つのChromeで複数タブを並列に使う
+# ==================================================
+# WebDriverのコマンドは1本ずつしか流せないが、ページの読み込み自体はタブごとに並行して進む。
+# そこで「対象タブへ切り替え→コマンド1回」をロックで直列化し、遷移は
+# window.location で投げっぱなしにする（driver.get は読み込み完了までロックを握るため使わない）。
+# 同一プロファイルなのでログインCookie・HTTPキャッシュは全タブで共有される。
+#
+# chromedriver は遷移中のタブへのコマンドを DOMContentLoaded まで待たせることがあるが、
+# その間も他タブの読み込みは進むので、全体の所要時間はおおむね最も遅いページ1枚分になる。
+#
+# BrowserTab は fetch_* が使う driver の一部（get / execute_script / page_source）だけを真似る。
+
+class BrowserTab:
+    def __init__(self, pool, handle):
+        self.pool = pool
+        self.driver = pool.driver
+        self.handle = handle
+        self._lock = pool._lock
+        self._navigating = False
+        self._old_origin = None
+
+    def _switch(self):
+        # 現在のタブは pool 側で覚えておき、切り替えの往復を省く
+        if self.pool._active != self.handle:
+            self.driver.switch_to.window(self.handle)
+            self.pool._active = self.handle
+
+    def get(self, url: str) -> None:
+        """ 遷移を開始してすぐ返る。完了判定は呼び出し側（PageWaiter）のポーリングに任せる """
+        with self._lock:
+            self._switch()
+            # 旧文書に目印を付け、その performance.timeOrigin（文書ごとに変わる）を覚えておく。
+            # 前回の遷移がまだ終わっていなければ止めて、遅れて確定した前のページを拾わないようにする。
+            # 遷移はスクリプトが返った後に始める（chromedriver が遷移待ちでこのコマンドを止めないように）
+            self._old_origin = self.driver.execute_script(
+                "var u = arguments[0]; if (arguments[1]) window.stop(); window.__umaiStale = true;"
+                " setTimeout(function () { window.location.href = u; }, 0); return performance.timeOrigin;",
+                url, self._navigating
+            )
+            self._navigating = True
+
+    def _still_navigating(self) -> bool:
+        """ get() 後の新しい文書に入れ替わったか（ロック内で呼ぶ） """
+        if not self._navigating: return False
+        # 目印が残っている、または timeOrigin が同じ＝旧文書。リダイレクト後のURLには依存しない
+        stale = self.driver.execute_script(
+            "return window.__umaiStale === true || performance.timeOrigin === arguments[0];", self._old_origin
+        )
+        if not stale: self._navigating = False
+        return bool(stale)
+
+    def execute_script(self, script, *args):
+        """ 遷移が確定するまでは None を返す（probe_page は loading 扱い） """
+        with self._lock:
+            self._switch()
+            if self._still_navigating(): return None
+            return self.driver.execute_script(script, *args)
+
+    @property
+    def page_source(self) -> str:
+        """ 要求したページがまだ表示されていなければ空文字（旧文書＝前のレースを解析させない） """
+        with self._lock:
+            self._switch()
+            if self._still_navigating(): return ""
+            return self.driver.page_source
+
+
+class TabPool:
+    def __init__(self, driver, num_tabs=3):
+        self.driver = driver
+        self._lock = threading.Lock()
+        self._free = queue.Queue()
+        # 既存のタブ（ログイン済み）をそのまま main として使う
+        self._active = driver.current_window_handle
+        self.main = BrowserTab(self, self._active)
+        self.tabs = [self.main]
+        with self._lock:
+            for _ in range(max(1, num_tabs) - 1):
+                driver.switch_to.new_window("tab")
+                self._active = driver.current_window_handle
+                self.tabs.append(BrowserTab(self, self._active))
+        for tab in self.tabs: self._free.put(tab)
+        self._executor = ThreadPoolExecutor(max_workers=len(self.tabs), thread_name_prefix="tab")
+
+    def _run_on_tab(self, fn):
+        tab = self._free.get()
+        try: return fn(tab)
+        finally: self._free.put(tab)
+
+    def map(self, calls: dict) -> dict:
+        """ {名前: fn(tab)} を空いているタブで並列実行し {名前: 戻り値}。例外はそのまま送出 """
+        futures = {name: self._executor.submit(self._run_on_tab, fn) for name, fn in calls.items()}
+        return {name: f.result() for name, f in futures.items()}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,188 @@
+import json
+import time
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ==================================================
+# Dify workflows/run クライアント
+# ==================================================
+# - Sessionでコネクションを再利用し、同時実行数をセマフォで制限
+# - ストリーム開始前の 429/5xx・接続エラーは指数バックオフで再試行
+# - SSEは空行区切りでイベント化（複数行の data: も連結して解釈）
+# - cancel_event で中断、TTFB・スループットを記録
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class DifyError(Exception):
+    pass
+
+class DifyCancelled(DifyError):
+    pass
+
+
+def iter_sse_events(byte_chunks):
+    """ バイト列の断片から (event名, data文字列) を順に返す """
+    buf, data_lines, event = b"", [], None
+    for chunk in byte_chunks:
+        buf += chunk
+        while True:
+            nl = buf.find(b"\n")
+            if nl < 0: break
+            line, buf = buf[:nl].rstrip(b"\r").decode("utf-8"), buf[nl + 1:]
+            if not line:
+                if data_lines or event: yield event or "message", "\n".join(data_lines)
+                data_lines, event = [], None
+                continue
+            if line.startswith(":"): continue
+            field, _, value = line.partition(":")
+            if value.startswith(" "): value = value[1:]
+            if field == "data": data_lines.append(value)
+            elif field == "event": event = value
+    if data_lines: yield event or "message", "\n".join(data_lines)
+
+
+def missing_outputs(streamed: str, outputs) -> list:
+    """
+    workflow_finished の出力のうち、text_chunk で未受信の部分を返す。
+    ストリームは追記しかできないので、テンプレートで前置きが付いた場合は本文の後ろへ回す
+    """
+    pieces = []
+    for v in outputs:
+        if not isinstance(v, str) or not v or v in streamed: continue
+        if streamed and streamed in v:
+            head, tail = v.split(streamed, 1)
+            new = tail + (("\n\n" + head.rstrip()) if head.strip() else "")
+        else:
+            new = ("\n\n" if streamed else "") + v
+        if new:
+            pieces.append(new)
+            streamed += new
+    return pieces
+
+
+class DifyClient:
+    def __init__(self, api_key, base_url="https://api.dify.ai/v1", max_concurrency=4, max_retries=3,
+                 backoff_sec=1.0, connect_timeout=10, read_timeout=90, user="keiba-bot"):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.timeout = (connect_timeout, read_timeout)
+        self.user = user
+        self._sem = threading.BoundedSemaphore(max(1, int(max_concurrency)))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(max_concurrency)))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._metrics = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    # --------------------------------------------------
+    # 接続（ストリーム開始前のみ再試行）
+    # --------------------------------------------------
+    def _open(self, payload, cancel_event, m):
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        last_err = None
+        for attempt in range(self.max_retries + 1):
+            if cancel_event is not None and cancel_event.is_set(): raise DifyCancelled("キャンセルされました")
+            m["attempts"] = attempt + 1
+            wait = self.backoff_sec * (2 ** attempt)
+            try:
+                res = self.session.post(f"{self.base_url}/workflows/run", headers=headers, json=payload,
+                                        stream=True, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_err = DifyError(f"接続エラー: {e}")
+            else:
+                if res.status_code == 200: return res
+                body = res.text[:200]
+                res.close()
+                last_err = DifyError(f"HTTP {res.status_code}: {body}")
+                if res.status_code not in RETRY_STATUS: raise last_err
+                retry_after = res.headers.get("Retry-After", "")
+                if retry_after.isdigit(): wait = max(wait, float(retry_after))
+            if attempt < self.max_retries:
+                # キャンセルされたら待機を打ち切る
+                if cancel_event is not None:
+                    if cancel_event.wait(wait): raise DifyCancelled("キャンセルされました")
+                else:
+                    time.sleep(wait)
+        raise last_err
+
+    def _acquire(self, cancel_event):
+        while not self._sem.acquire(timeout=0.5):
+            if cancel_event is not None and cancel_event.is_set(): raise DifyCancelled("キャンセルされました")
+
+    # --------------------------------------------------
+    # 実行
+    # --------------------------------------------------
+    def stream_workflow(self, text: str, cancel_event=None, metrics=None):
+        """ 出力テキストを断片ごとに返すジェネレータ。metrics(dict)に計測値を書き込む """
+        if not self.api_key: raise DifyError("DIFY_API_KEY 未設定")
+        m = metrics if metrics is not None else {}
+        m.update({"attempts": 0, "ttfb_sec": None, "total_sec": None, "chars": 0, "chars_per_sec": None, "error": None})
+        payload = {"inputs": {"text": text}, "response_mode": "streaming", "user": self.user}
+
+        t_wait = time.perf_counter()
+        self._acquire(cancel_event)
+        t0 = time.perf_counter()
+        m["queue_sec"] = t0 - t_wait
+        res = None
+        try:
+            res = self._open(payload, cancel_event, m)
+            streamed = ""
+            for event, data in iter_sse_events(res.iter_content(chunk_size=1024)):
+                if cancel_event is not None and cancel_event.is_set(): raise DifyCancelled("キャンセルされました")
+                if event == "ping" or not data: continue
+                try: obj = json.loads(data)
+                except ValueError as e: raise DifyError(f"不正なSSEデータ: {data[:100]}") from e
+
+                kind = obj.get("event", event)
+                out = []
+                if kind == "text_chunk":
+                    out.append(obj.get("data", {}).get("text", ""))
+                elif kind == "error":
+                    raise DifyError(obj.get("message") or obj.get("code") or "Difyエラー")
+                elif kind == "workflow_finished":
+                    d = obj.get("data", {})
+                    if d.get("status") in ("failed", "stopped"): raise DifyError(d.get("error") or "ワークフロー失敗")
+                    # text_chunk で受信済みの部分は重複させず、足りない出力（複数出力・テンプレート）だけ足す
+                    out.extend(missing_outputs(streamed, (d.get("outputs") or {}).values()))
+                elif "answer" in obj:
+                    out.append(obj.get("answer", ""))
+
+                for piece in out:
+                    if not piece: continue
+                    if m["ttfb_sec"] is None: m["ttfb_sec"] = time.perf_counter() - t0
+                    streamed += piece
+                    m["chars"] += len(piece)
+                    yield piece
+        except DifyError as e:
+            m["error"] = str(e)
+            raise
+        except requests.RequestException as e:
+            m["error"] = f"受信エラー: {e}"
+            raise DifyError(m["error"]) from e
+        finally:
+            if res is not None: res.close()
+            self._sem.release()
+            m["total_sec"] = time.perf_counter() - t0
+            if m["chars"] and m["total_sec"] > 0: m["chars_per_sec"] = m["chars"] / m["total_sec"]
+            with self._lock: self._metrics.append(dict(m))
+
+    def stats(self) -> dict:
+        """ 直近の呼び出しの TTFB p50/p95・平均スループット・失敗数 """
+        with self._lock: ms = list(self._metrics)
+        ttfb = sorted(x["ttfb_sec"] for x in ms if x["ttfb_sec"] is not None)
+        cps = [x["chars_per_sec"] for x in ms if x["chars_per_sec"]]
+        pick = lambda p: ttfb[min(len(ttfb) - 1, int(p * len(ttfb)))] if ttfb else None
+        return {
+            "calls": len(ms),
+            "errors": sum(1 for x in ms if x["error"]),
+            "retries": sum(max(x["attempts"] - 1, 0) for x in ms),
+            "ttfb_p50_sec": pick(0.5),
+            "ttfb_p95_sec": pick(0.95),
+            "chars_per_sec_avg": sum(cps) / len(cps) if cps else None,
+        }
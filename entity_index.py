@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import threading
+import unicodedata
+from functools import lru_cache
+
+# ==================================================
+# 騎手・馬名のエンティティ索引
+# ==================================================
+# 取得ページから少しずつ学習し、ソース間の突き合わせを dict 参照で行う。
+#   騎手: 略称(netkeiba 出馬表 "横山武") → フルネーム(過去走 "横山武史")
+#   馬  : 正規化名 → 馬ID（keibabook / Yahoo / Difyの表記揺れを吸収）
+# 保存先JSONの jockey_abbr に手で対応を追記すれば、略称の取り違えを恒久的に直せる。
+
+_MARKS = re.compile(r"[▲△☆★◇◆□■○●◎]")
+_BRACKETS = re.compile(r"[\(\[][^\)\]]*[\)\]]")
+_SPACES = re.compile(r"\s+")
+
+@lru_cache(maxsize=8192)
+def normalize_name(s: str) -> str:
+    """ NFKC・空白除去・減量記号/(地)(外)等の付記を除去 """
+    if not s: return ""
+    t = unicodedata.normalize("NFKC", s)
+    t = _BRACKETS.sub("", t)
+    t = _MARKS.sub("", t)
+    return _SPACES.sub("", t)
+
+
+class EntityIndex:
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self.jockey_full = set()
+        self.jockey_abbr = {}
+        self.horses = {}
+        self._next_horse = 1
+        self._prefix = {}
+        if path: self._load()
+
+    # --------------------------------------------------
+    # 永続化
+    # --------------------------------------------------
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return
+        for full in d.get("jockey_full", []): self._add_full(full)
+        self.jockey_abbr.update(d.get("jockey_abbr", {}))
+        self.horses.update(d.get("horses", {}))
+        self._next_horse = int(d.get("next_horse", len(self.horses) + 1))
+
+    def save(self):
+        if not self.path or not self._dirty: return
+        # 書き込みは1本ずつ（古いスナップショットが新しいものを上書きしないように）
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty: return
+                # 他スレッドの追加と並行して dump できるよう、ロック内でコピーを取る
+                d = {"jockey_full": sorted(self.jockey_full), "jockey_abbr": dict(self.jockey_abbr),
+                     "horses": dict(self.horses), "next_horse": self._next_horse}
+                self._dirty = False
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = f"{self.path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(d, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError:
+                self._dirty = True
+                raise
+
+    # --------------------------------------------------
+    # 騎手
+    # --------------------------------------------------
+    def _add_full(self, full: str):
+        if full in self.jockey_full: return
+        self.jockey_full.add(full)
+        for i in range(1, len(full) + 1):
+            self._prefix.setdefault(full[:i], set()).add(full)
+
+    def learn_jockey(self, full=None, abbr=None):
+        """ フルネームの登録、または略称→フルネームの確定対応を登録 """
+        full, abbr = normalize_name(full or ""), normalize_name(abbr or "")
+        if not full and not abbr: return
+        with self._lock:
+            if full and full not in self.jockey_full:
+                self._add_full(full)
+                self._dirty = True
+            if full and abbr and full.startswith(abbr) and self.jockey_abbr.get(abbr) != full:
+                self.jockey_abbr[abbr] = full
+                self._dirty = True
+
+    def resolve_jockey(self, name: str):
+        """ 略称からフルネーム。候補が1人に絞れない場合は None """
+        c = normalize_name(name)
+        if not c: return None
+        full = self.jockey_abbr.get(c)
+        if full: return full
+        if c in self.jockey_full: return c
+        # 確定対応が無い場合は、既知のフルネームで先頭一致が1人だけなら採用（保存はしない）
+        # 候補集合は他スレッドの _add_full で増えるのでロック内で読む
+        with self._lock:
+            cands = self._prefix.get(c)
+            if cands and len(cands) == 1: return next(iter(cands))
+        return None
+
+    def same_jockey(self, prev_full, curr_abbr) -> bool:
+        if not prev_full or not curr_abbr: return False
+        p, c = normalize_name(prev_full), normalize_name(curr_abbr)
+        if p == c: return True
+        full = self.resolve_jockey(c)
+        if full: return full == p
+        # 未確定の略称は従来どおり先頭一致で判定 (例: 原 ← 原優介)
+        return bool(c) and p.startswith(c)
+
+    # --------------------------------------------------
+    # 馬
+    # --------------------------------------------------
+    def horse_id(self, name: str, create=True):
+        key = normalize_name(name)
+        if not key: return None
+        hid = self.horses.get(key)
+        if hid is not None or not create: return hid
+        with self._lock:
+            hid = self.horses.get(key)
+            if hid is None:
+                hid = f"h{self._next_horse}"
+                self._next_horse += 1
+                self.horses[key] = hid
+                self._dirty = True
+        return hid
+
+    def grades_by_id(self, evals: dict) -> dict:
+        """ {馬名: 評価} → {馬ID: 評価}。索引に無い馬名（AIの表記ミス等）は捨てる """
+        out = {}
+        for name, grade in (evals or {}).items():
+            hid = self.horse_id(name, create=False)
+            if hid: out[hid] = grade
+        return out
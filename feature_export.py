@@ -0,0 +1,114 @@
+import os
+import datetime
+import threading
+import pandas as pd
+
+# ==================================================
+# 1頭1行の特徴量エクスポート (Parquet / Arrow IPC / CSV)
+# ==================================================
+# レース完了ごとに追記する。出力先（形式ごとに別ルート）:
+#   {root}/parquet/date=YYYY-MM-DD/{race_id}_{mode}.parquet
+#   {root}/arrow/date=YYYY-MM-DD/{race_id}_{mode}.arrow
+#   {root}/csv/date=YYYY-MM-DD/features.csv
+# date= は開催日（不明なら date=unknown）のHive形式パーティションなので、
+# pd.read_parquet("{root}/parquet") や pyarrow.dataset で1日分をまとめて読める。
+# 同じレースを再実行しても行は重複しない。
+
+FEATURE_COLUMNS = {
+    "race_id": "string",
+    "mode": "string",
+    "year": "string",
+    "kai": "string",
+    "place": "string",
+    "day": "string",
+    "race_num": "Int64",
+    "race_date": "string",
+    "race_title": "string",
+    "distance": "Int64",
+    "track_type": "string",
+    "course_variant": "string",
+    "is_shinba": "boolean",
+    "umaban": "Int64",
+    "waku": "Int64",
+    "horse_id": "string",
+    "horse_name": "string",
+    "jockey": "string",
+    "prev_jockey": "string",
+    "jockey_changed": "boolean",
+    "sp_best": "Int64",
+    "sp_3": "Int64",
+    "sp_2": "Int64",
+    "sp_last": "Int64",
+    "raw_ability": "Float64",
+    "speed_index": "Float64",
+    "kaisai_bias": "Int64",
+    "course_bias": "Int64",
+    "bias_total": "Int64",
+    "kinsou_index": "Float64",
+    "fac_crs": "string",
+    "fac_dis": "string",
+    "fac_zen": "string",
+    "fac_deashi": "string",
+    "fac_kettou": "string",
+    "fac_ugoki": "string",
+    "danwa": "string",
+    "interview": "string",
+    "chokyo_tanpyo": "string",
+    "chokyo_details": "string",
+    "past_runs": "string",
+    "ai_grade": "string",
+    "exported_at": "datetime64[ns]",
+}
+
+def rows_to_frame(rows) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=list(FEATURE_COLUMNS))
+    return df.astype(FEATURE_COLUMNS)
+
+
+class FeatureExporter:
+    def __init__(self, root="exports/features", formats=("parquet", "csv")):
+        self.root = root
+        self.formats = tuple(formats)
+        self._lock = threading.Lock()
+
+    def _partition_dir(self, fmt, race_date) -> str:
+        # 実行日ではなく開催日で分ける（前日の事前実行・深夜の再実行で日がずれないように）
+        out_dir = os.path.join(self.root, fmt, f"date={race_date or 'unknown'}")
+        os.makedirs(out_dir, exist_ok=True)
+        return out_dir
+
+    def _upsert_csv(self, path, df):
+        """ 1日1ファイルのCSVへ、同じ (race_id, mode) の既存行を置き換えて書く """
+        if os.path.exists(path):
+            old = pd.read_csv(path, dtype=str, keep_default_na=False)
+            key = df.iloc[0]
+            old = old[~((old["race_id"] == key["race_id"]) & (old["mode"] == key["mode"]))]
+            df = pd.concat([old.reindex(columns=list(FEATURE_COLUMNS)), df], ignore_index=True)
+        tmp = f"{path}.tmp"
+        df.to_csv(tmp, index=False, encoding="utf-8")
+        os.replace(tmp, path)
+
+    def write_race(self, rows) -> list:
+        """ 1レース分の行を書き出し、書いたファイルパスのリストを返す """
+        if not rows or not self.formats: return []
+        now = datetime.datetime.now()
+        df = rows_to_frame([{**r, "exported_at": now} for r in rows])
+        race_date = rows[0].get("race_date")
+        stem = f"{rows[0]['race_id']}_{rows[0]['mode']}"
+        written = []
+        with self._lock:
+            # 同一レースの再実行は上書き（レース単位のファイル）
+            if "parquet" in self.formats:
+                path = os.path.join(self._partition_dir("parquet", race_date), f"{stem}.parquet")
+                df.to_parquet(path, index=False)
+                written.append(path)
+            if "arrow" in self.formats:
+                path = os.path.join(self._partition_dir("arrow", race_date), f"{stem}.arrow")
+                df.to_feather(path)
+                written.append(path)
+            # CSVは1日1ファイル（レース単位で置き換え）
+            if "csv" in self.formats:
+                path = os.path.join(self._partition_dir("csv", race_date), "features.csv")
+                self._upsert_csv(path, df)
+                written.append(path)
+        return written
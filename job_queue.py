@@ -0,0 +1,126 @@
+import time
+import queue
+import threading
+
+# ==================================================
+# プロセス共通のレース処理キュー
+# ==================================================
+# 全セッションで1つのキューを共有し、ワーカー数(=Chrome数)を固定する。
+# 同じ (race_id, mode) の依頼は1つのタスクにまとめ、結果を共有する。
+
+class RaceTask:
+    """ 1レース分の処理単位。複数セッションから購読される """
+
+    def __init__(self, key, params):
+        self.key = key
+        self.params = params
+        self.status = "待機中（キュー待ち）"
+        self.partial = ""
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.cancelled = threading.Event()
+        self.finished_at = None
+
+    def update(self, status=None, partial=None):
+        if status is not None: self.status = status
+        if partial is not None: self.partial = partial
+
+    def cancel(self):
+        """ 実行中の処理（Dify呼び出し等）に中断を要求する """
+        self.cancelled.set()
+
+    def _finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.partial = ""
+        self.finished_at = time.time()
+        self.done.set()
+
+    def is_reusable(self, ttl: float) -> bool:
+        # キャンセル済みは実行中・キュー待ちでも新しい購読者に渡さない
+        if self.cancelled.is_set(): return False
+        if not self.done.is_set(): return True
+        if self.error is not None: return False
+        # 取得失敗(None)はページ未公開などの可能性があるので、次の依頼で取り直す
+        if not self.result: return False
+        # AI分析が失敗した結果（途中までの出力＋エラー表示）は共有しない
+        if isinstance(self.result, dict) and self.result.get("ai_error"): return False
+        return (time.time() - self.finished_at) < ttl
+
+
+class RaceJobQueue:
+    """
+    handler(task, worker_state) をワーカースレッドで実行する。
+    worker_state はワーカー毎の dict（ドライバ等を保持）で、
+    アイドル時・終了時に on_idle(worker_state) で資源を解放する。
+    """
+
+    def __init__(self, handler, num_workers=2, result_ttl=1800, idle_timeout=120, on_idle=None):
+        self._handler = handler
+        self._on_idle = on_idle
+        self._result_ttl = result_ttl
+        self._idle_timeout = idle_timeout
+        self._queue = queue.Queue()
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        for i in range(max(1, int(num_workers))):
+            t = threading.Thread(target=self._worker_loop, name=f"race-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def submit(self, key, params) -> RaceTask:
+        """ 同一キーの実行中/完了済みタスクがあればそれを返す（重複排除） """
+        with self._lock:
+            self._evict_expired()
+            task = self._tasks.get(key)
+            if task is not None and task.is_reusable(self._result_ttl):
+                return task
+            task = RaceTask(key, params)
+            self._tasks[key] = task
+        self._queue.put(task)
+        return task
+
+    def cancel(self, key) -> bool:
+        with self._lock: task = self._tasks.get(key)
+        if task is None or task.done.is_set(): return False
+        task.cancel()
+        return True
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """ 全ワーカーを止め、保持しているブラウザ等を解放する（ハーネス/テスト用） """
+        if cancel_pending:
+            with self._lock: tasks = list(self._tasks.values())
+            for t in tasks: t.cancel()
+        for _ in self._workers: self._queue.put(None)
+        if wait:
+            for t in self._workers: t.join()
+
+    def _evict_expired(self):
+        for key in [k for k, t in self._tasks.items() if not t.is_reusable(self._result_ttl)]:
+            del self._tasks[key]
+
+    def _worker_loop(self):
+        state = {}
+        while True:
+            try:
+                task = self._queue.get(timeout=self._idle_timeout)
+            except queue.Empty:
+                # アイドルが続いたらChromeを閉じてメモリを返す
+                if self._on_idle and state: self._on_idle(state)
+                continue
+            if task is None:
+                if self._on_idle and state: self._on_idle(state)
+                self._queue.task_done()
+                return
+            if task.cancelled.is_set():
+                task._finish(error=RuntimeError("キャンセルされました"))
+                self._queue.task_done()
+                continue
+            try:
+                task.update(status="処理開始...")
+                task._finish(result=self._handler(task, state))
+            except Exception as e:
+                task._finish(error=e)
+            finally:
+                self._queue.task_done()
@@ -1,8 +1,10 @@
+import gc
+import os
 import time
 import json
 import re
 import math
-import requests
+from functools import lru_cache
 import streamlit as st
 import streamlit.components.v1 as components
 from selenium import webdriver
@@ -11,15 +13,58 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from bs4 import BeautifulSoup, NavigableString
+from job_queue import RaceJobQueue
+from page_cache import PageCache
+from warmup import WarmupScheduler
+from feature_export import FeatureExporter
+from dify_client import DifyClient, DifyError
+from entity_index import EntityIndex
+from rss_monitor import PeakRssMonitor, process_tree_rss_mb
+from text_norm import clean_text_ja, digits_only, digits_to_int, safe_int
+from page_wait import PageWaiter, PageLoadError
+from browser_tabs import TabPool
 
 # ==================================================
 # 【設定エリア】secretsから読み込み
 # ==================================================
-KEIBA_ID = st.secrets.get("KEIBA_ID", "")
-KEIBA_PASS = st.secrets.get("KEIBA_PASS", "")
-DIFY_API_KEY = st.secrets.get("DIFY_API_KEY", "")
+def _secret(name: str, default=""):
+    """ 環境変数 > st.secrets > default の順。文字列以外の既定値を持つ項目はJSONとして解釈 """
+    if name in os.environ:
+        val = os.environ[name]
+        return val if isinstance(default, str) else json.loads(val)
+    try: return st.secrets.get(name, default)
+    except Exception: return default
 
-BASE_URL = "https://s.keibabook.co.jp"
+KEIBA_ID = _secret("KEIBA_ID", "")
+KEIBA_PASS = _secret("KEIBA_PASS", "")
+DIFY_API_KEY = _secret("DIFY_API_KEY", "")
+
+# 接続先（負荷試験ではローカルのモックサーバへ向ける）
+BASE_URL = _secret("BASE_URL", "https://s.keibabook.co.jp")
+NETKEIBA_URL = _secret("NETKEIBA_URL", "https://race.netkeiba.com")
+YAHOO_URL = _secret("YAHOO_URL", "https://sports.yahoo.co.jp")
+DIFY_API_URL = _secret("DIFY_API_URL", "https://api.dify.ai/v1")
+
+# Dify 同時実行数・再試行（全ワーカーで1つのクライアントを共有）
+DIFY_CLIENT = DifyClient(
+    DIFY_API_KEY, DIFY_API_URL,
+    max_concurrency=int(_secret("DIFY_MAX_CONCURRENCY", 4)),
+    max_retries=int(_secret("DIFY_MAX_RETRIES", 3)),
+    read_timeout=int(_secret("DIFY_READ_TIMEOUT", 90)),
+)
+
+# 解析済みページのキャッシュ（事前取得スケジューラと共用）
+CACHE_DIR = _secret("CACHE_DIR", ".umai_cache")
+CACHE_TTL_SEC = int(_secret("CACHE_TTL_SEC", 6 * 3600))
+PAGE_CACHE = PageCache(CACHE_DIR, ttl=CACHE_TTL_SEC)
+
+# 騎手略称・馬名の索引（ソース間の突き合わせ用、取得のたびに学習）
+ENTITY_INDEX = EntityIndex(os.path.join(CACHE_DIR, "entity_index.json"))
+
+# 1頭1行の特徴量エクスポート（空リストで無効化）
+EXPORT_DIR = _secret("EXPORT_DIR", "exports/features")
+EXPORT_FORMATS = list(_secret("EXPORT_FORMATS", ["parquet", "csv"]))
+FEATURE_EXPORTER = FeatureExporter(EXPORT_DIR, formats=EXPORT_FORMATS)
 
 # 競馬ブック PLACEコード → netkeiba/Yahoo 競馬場コード (共通)
 KEIBABOOK_TO_NETKEIBA_PLACE = {
@@ -73,36 +118,34 @@ BABA_BIAS_DATA = {
 # ==================================================
 # ユーティリティ
 # ==================================================
-def _clean_text_ja(s: str) -> str:
-    if not s: return ""
-    s = s.replace("\u3000", " ")
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+# 正規化・数値パースは text_norm に集約（プリコンパイル済み・メモ化）
+_clean_text_ja = clean_text_ja
+_safe_int = safe_int
+
+# 行ごとに使うパターンはモジュール読み込み時にコンパイルしておく
+_RE_DISTANCE = re.compile(r'(\d{3,4})')
+_RE_PAREN = re.compile(r"\(.*?\)")
+_RE_PASSING = re.compile(r'^([\d\-]+)')
+_RE_DATA03_JOCKEY = re.compile(r'\d+人\s+(.+?)\s+\d+\.\d')
+_RE_JOCKEY_NOISE = re.compile(r'[0-9\.]+|牡|牝|セ|栗|鹿|芦|黒')
+_RE_KAISAI = re.compile(r'(\d+)回([^0-9]+?)(\d+)日目')
+_RE_DISTANCE_M = re.compile(r'(\d{3,4})m')
+_RE_RACE_DATE = re.compile(r'(\d{4})[年/](\d{1,2})[月/](\d{1,2})')
+_RE_DIFY_EVAL = re.compile(r'\|\s*\d+\s*\|\s*([^|（\(]+)[^|]*\|\s*[^|]*\|\s*[^|]*\|\s*([SABCDEFG])\s*\|')
 
 def _is_missing_marker(s: str) -> bool:
     t = _clean_text_ja(s)
     return t in {"－", "-", "—", "―", "‐", ""}
 
-def _safe_int(s, default=0) -> int:
-    try:
-        if s is None: return default
-        if isinstance(s, (int, float)): return int(s)
-        ss = str(s).strip()
-        ss = re.sub(r"[^0-9\-]", "", ss)
-        if ss in {"", "-", "－"}: return default
-        return int(ss)
-    except: return default
-
 def extract_distance_int(dist_str: str) -> int:
-    match = re.search(r'(\d{3,4})', str(dist_str))
+    match = _RE_DISTANCE.search(str(dist_str))
     if match: return int(match.group(1))
     return 0
 
 def parse_dify_evaluation(ai_text: str) -> dict:
     """ DifyのMarkdownテーブルから {馬名: 評価ランク} の辞書を作成 """
     eval_map = {}
-    pattern = r'\|\s*\d+\s*\|\s*([^|（\(]+)[^|]*\|\s*[^|]*\|\s*[^|]*\|\s*([SABCDEFG])\s*\|'
-    matches = re.finditer(pattern, ai_text)
+    matches = _RE_DIFY_EVAL.finditer(ai_text)
     for m in matches:
         name = m.group(1).strip()
         grade = m.group(2).strip()
@@ -203,12 +246,19 @@ def compute_speed_metrics(cpu_data: dict) -> dict:
     return out
 
 def extract_race_info(race_title: str) -> dict:
-    result = {"place": None, "distance": None, "track_type": None, "day": None, "course_variant": ""}
-    p_match = re.search(r'(\d+)回([^0-9]+?)(\d+)日目', race_title)
+    # 同じレース名で馬の数だけ呼ばれるのでキャッシュ（呼び出し側の変更に備えてコピーを返す）
+    return dict(_extract_race_info(race_title))
+
+@lru_cache(maxsize=256)
+def _extract_race_info(race_title: str) -> dict:
+    result = {"place": None, "distance": None, "track_type": None, "day": None, "course_variant": "", "date": None}
+    dt_match = _RE_RACE_DATE.search(race_title)
+    if dt_match: result["date"] = "{}-{:02}-{:02}".format(*map(int, dt_match.groups()))
+    p_match = _RE_KAISAI.search(race_title)
     if p_match:
         result["place"] = p_match.group(2).strip()
         result["day"] = int(p_match.group(3))
-    d_match = re.search(r'(\d{3,4})m', race_title)
+    d_match = _RE_DISTANCE_M.search(race_title)
     if d_match: result["distance"] = d_match.group(1)
     if 'ダート' in race_title: result["track_type"] = "dirt"
     elif '芝' in race_title: result["track_type"] = "turf"
@@ -263,14 +313,28 @@ def login_keibabook(driver: webdriver.Chrome) -> None:
         time.sleep(1.0)
     except: pass
 
+# ==================================================
+# ページ読み込み（種別ごとの完了判定・ホスト別に学習したタイムアウト）
+# ==================================================
+PAGE_WAITER = PageWaiter()
+
+def _load_page(driver, page_type: str, url: str) -> str:
+    """
+    ready / nodata / timeout。nodata は要素待ちをせず即座に返る。
+    エラー表示・ログインフォームは PageLoadError を送出し、ワーカー側でブラウザ再作成＋再ログインさせる
+    """
+    t0 = time.perf_counter()
+    driver.get(url)
+    outcome = PAGE_WAITER.wait(driver, page_type, url, t0)
+    if outcome == "error": raise PageLoadError(f"{page_type} の取得でエラー/ログイン画面を検出: {url}")
+    return outcome
+
 # ==================================================
 # スクレイピング関数の各機能
 # ==================================================
 def fetch_keibabook_danwa(driver, race_id: str):
     url = f"{BASE_URL}/cyuou/danwa/0/{race_id}"
-    driver.get(url)
-    try: WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, "table.default.danwa")))
-    except: pass
+    if _load_page(driver, "danwa", url) == "nodata": return {"header_text": ""}, {}
     soup = BeautifulSoup(driver.page_source, "html.parser")
     racetitle = soup.find("div", class_="racetitle")
     header_info = {"header_text": "\n".join([p.get_text(strip=True) for p in racetitle.find_all("p")]) if racetitle else ""}
@@ -285,27 +349,26 @@ def fetch_keibabook_danwa(driver, race_id: str):
                 waku_p = waku_td.find("p")
                 if waku_p:
                     for cls in waku_p.get("class", []):
-                        if cls.startswith("waku"): current_waku = re.sub(r"\D", "", cls); break
-                current_umaban = re.sub(r"\D", "", umaban_td.get_text(strip=True))
+                        if cls.startswith("waku"): current_waku = digits_only(cls); break
+                current_umaban = digits_only(umaban_td.get_text(strip=True))
                 horses[current_umaban] = {"name": _clean_text_ja(bamei_td.get_text(strip=True)), "waku": current_waku or "?", "danwa": ""}
                 continue
             danwa_td = tr.find("td", class_="danwa")
             if danwa_td and current_umaban:
                 txt = _clean_text_ja(danwa_td.get_text("\n", strip=True))
                 horses[current_umaban]["danwa"] = (horses[current_umaban]["danwa"] + " " + txt).strip()
+    soup.decompose()
     return header_info, horses
 
 def fetch_keibabook_chokyo(driver, race_id: str):
     url = f"{BASE_URL}/cyuou/cyokyo/0/{race_id}"
-    driver.get(url)
-    try: WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "cyokyo")))
-    except: pass
+    if _load_page(driver, "cyokyo", url) == "nodata": return {}
     soup = BeautifulSoup(driver.page_source, "html.parser")
     data = {}
     for tbl in soup.find_all("table", class_="cyokyo"):
         umaban_td = tbl.find("td", class_="umaban")
         if not umaban_td: continue
-        umaban = re.sub(r"\D", "", umaban_td.get_text(strip=True))
+        umaban = digits_only(umaban_td.get_text(strip=True))
         tanpyo = _clean_text_ja(tbl.find("td", class_="tanpyo").get_text(strip=True)) if tbl.find("td", class_="tanpyo") else "なし"
         details_parts, detail_cell = [], tbl.find("td", colspan="5")
         if detail_cell:
@@ -321,33 +384,32 @@ def fetch_keibabook_chokyo(driver, race_id: str):
                     if header_info or time_str: details_parts.append(f"[{header_info}] {time_str}{awase_str}")
                     header_info = ""
         data[umaban] = {"tanpyo": tanpyo, "details": "\n".join(details_parts) if details_parts else "詳細なし"}
+    soup.decompose()
     return data
 
 def fetch_zenkoso_interview(driver, race_id: str):
     url = f"{BASE_URL}/cyuou/syoin/{race_id}"
-    driver.get(url)
-    try: WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, "table.default.syoin")))
-    except: pass
+    # 新馬戦などは表自体が無いので、データなし表示/DOM完了で即終了する
+    if _load_page(driver, "syoin", url) == "nodata": return {}
     soup = BeautifulSoup(driver.page_source, "html.parser")
     interview_data, table = {}, soup.find("table", class_=lambda c: c and "syoin" in str(c))
     if table and table.tbody:
         current_umaban = None
         for tr in table.tbody.find_all("tr", recursive=False):
             umaban_td = tr.find("td", class_="umaban")
-            if umaban_td: current_umaban = re.sub(r"\D", "", umaban_td.get_text(strip=True)); continue
+            if umaban_td: current_umaban = digits_only(umaban_td.get_text(strip=True)); continue
             syoin_td = tr.find("td", class_="syoin")
             if syoin_td and current_umaban:
                 meta = syoin_td.find("div", class_="syoindata")
                 if meta: meta.decompose()
                 txt = _clean_text_ja(syoin_td.get_text(" ", strip=True))
                 if not _is_missing_marker(txt): interview_data[current_umaban] = txt
+    soup.decompose()
     return interview_data
 
 def fetch_keibabook_cpu_data(driver, race_id: str, is_shinba: bool = False):
     url = f"{BASE_URL}/cyuou/cpu/{race_id}"
-    driver.get(url)
-    try: WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "main")))
-    except: pass
+    if _load_page(driver, "cpu", url) == "nodata": return {}
     
     soup = BeautifulSoup(driver.page_source, "html.parser")
     data = {}
@@ -359,17 +421,15 @@ def fetch_keibabook_cpu_data(driver, race_id: str, is_shinba: bool = False):
             umaban_td = tr.find("td", class_="umaban")
             if not umaban_td: continue
             
-            umaban = re.sub(r"\D", "", umaban_td.get_text(strip=True))
+            umaban = digits_only(umaban_td.get_text(strip=True))
             tds = tr.find_all("td")
             
             # 列数が足りない場合はスキップ (通常8列以上あるはず)
             if len(tds) < 8: continue
             
             def get_val(idx):
-                txt = tds[idx].get_text(strip=True)
                 # 数値以外を除去してint化
-                val = int(re.sub(r"\D", "", txt)) if re.sub(r"\D", "", txt) else 0
-                return val
+                return digits_to_int(tds[idx].get_text(strip=True), 0)
 
             data[umaban] = {
                 "sp_best": get_val(4), # 最高
@@ -387,7 +447,7 @@ def fetch_keibabook_cpu_data(driver, race_id: str, is_shinba: bool = False):
         for tr in factor_tbl.tbody.find_all("tr"):
             umaban_td = tr.find("td", class_="umaban")
             if not umaban_td: continue
-            umaban = re.sub(r"\D", "", umaban_td.get_text(strip=True))
+            umaban = digits_only(umaban_td.get_text(strip=True))
             
             tds = tr.find_all("td")
             if len(tds) < 6: continue
@@ -404,13 +464,14 @@ def fetch_keibabook_cpu_data(driver, race_id: str, is_shinba: bool = False):
             else:
                 data[umaban].update({"fac_crs": get_m(5), "fac_dis": get_m(6), "fac_zen": get_m(7)})
                 
+    soup.decompose()
     return data
 # ==================================================
 # Netkeiba & 近走指数
 # ==================================================
 def calculate_passing_order_bonus(pass_str: str, final_rank: int) -> float:
     if not pass_str or pass_str == "-": return 0.0
-    clean_pass = re.sub(r"\(.*?\)", "", pass_str).strip()
+    clean_pass = _RE_PAREN.sub("", pass_str).strip()
     parts = clean_pass.split("-")
     positions = []
     for p in parts:
@@ -429,35 +490,39 @@ def fetch_netkeiba_data(driver, year, kai, place, day, race_num):
     nk_place = KEIBABOOK_TO_NETKEIBA_PLACE.get(place, "")
     if not nk_place: return {}
     nk_race_id = f"{year}{nk_place}{kai.zfill(2)}{day.zfill(2)}{race_num.zfill(2)}"
-    url = f"https://race.netkeiba.com/race/shutuba_past.html?race_id={nk_race_id}"
-    driver.get(url)
-    try: WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.CLASS_NAME, "Shutuba_Past5_Table")))
-    except: return {}
+    url = f"{NETKEIBA_URL}/race/shutuba_past.html?race_id={nk_race_id}"
+    # netkeiba はログイン不要なので、エラーページでもレース全体はやり直さず列が欠けるだけにする
+    try:
+        if _load_page(driver, "netkeiba", url) != "ready": return {}
+    except PageLoadError: return {}
     soup = BeautifulSoup(driver.page_source, "html.parser")
     data = {}
     for tr in soup.find_all("tr", class_="HorseList"):
         umaban_tds, umaban = tr.find_all("td", class_="Waku"), ""
         for td in umaban_tds:
-            txt = re.sub(r"\D", "", td.get_text(strip=True))
+            txt = digits_only(td.get_text(strip=True))
             if txt: umaban = txt; break
         if not umaban: continue
         
         # --- ★修正: 騎手名を<a>タグから正確に取得 ---
         jockey_td = tr.find("td", class_="Jockey")
-        jockey = "不明"
+        jockey, jockey_full = "不明", None
         if jockey_td:
             a_tag = jockey_td.find("a")
             if a_tag:
                 jockey = _clean_text_ja(a_tag.get_text(strip=True))
+                # title にフルネームがあれば略称との確定対応として使う
+                title = _clean_text_ja(a_tag.get("title", ""))
+                if len(title) > len(jockey): jockey_full = title
             else:
                 # aタグが無い場合のフォールバック（テキスト全体から抽出）
                 # 通常はaタグがあるはずだが、万が一のため
                 full_text = jockey_td.get_text(strip=True)
                 # 斤量や性別を除去する簡易処理（数字や特定の文字を除く）
-                jockey = re.sub(r'[0-9\.]+|牡|牝|セ|栗|鹿|芦|黒', '', full_text).strip()
+                jockey = _RE_JOCKEY_NOISE.sub('', full_text).strip()
         # ---------------------------------------------
         
-        past_str_list, valid_runs = [], []
+        past_str_list, valid_runs, past_jockeys = [], [], []
         prev_jockey = None # 前走騎手格納用
 
         # Pastカラムを走査 (最大3走)
@@ -473,25 +538,28 @@ def fetch_netkeiba_data(driver, year, kai, place, day, race_num):
                 rank = rank_tag.get_text(strip=True) if rank_tag else "?"
                 passing_order, d06 = "", td.find("div", class_="Data06")
                 if d06:
-                    match = re.match(r'^([\d\-]+)', d06.get_text(strip=True))
+                    match = _RE_PASSING.match(d06.get_text(strip=True))
                     if match: passing_order = match.group(1)
                 
-                # 前走(index 0)のData03から騎手名を抽出
-                if idx == 0:
-                    d03 = td.find("div", class_="Data03")
-                    if d03:
-                        d03_text = _clean_text_ja(d03.get_text(strip=True))
-                        # Data03形式例: "18頭 2番 14人 坂井瑠星 58.0"
-                        j_match = re.search(r'\d+人\s+(.+?)\s+\d+\.\d', d03_text)
-                        if j_match:
-                            prev_jockey = j_match.group(1).strip()
-                        else:
-                            parts = d03_text.split()
-                            if len(parts) >= 2: prev_jockey = parts[-2]
+                # Data03から騎手名(フルネーム)を抽出。前走(index 0)は乗り替わり判定に使う
+                d03 = td.find("div", class_="Data03")
+                if d03:
+                    d03_text = _clean_text_ja(d03.get_text(strip=True))
+                    # Data03形式例: "18頭 2番 14人 坂井瑠星 58.0"
+                    j_match = _RE_DATA03_JOCKEY.search(d03_text)
+                    past_jockey = None
+                    if j_match:
+                        past_jockey = j_match.group(1).strip()
+                    else:
+                        parts = d03_text.split()
+                        if len(parts) >= 2: past_jockey = parts[-2]
+                    if past_jockey:
+                        past_jockeys.append(past_jockey)
+                        if idx == 0: prev_jockey = past_jockey
 
                 past_str_list.append(f"[{date_place} {race_name_dist} {passing_order}→{rank}着]")
                 try:
-                    rank_int = int(re.sub(r"\D", "", rank))
+                    rank_int = int(digits_only(rank))
                     valid_runs.append({"rank_int": rank_int, "bonus": calculate_passing_order_bonus(passing_order, rank_int)})
                 except: pass
         
@@ -500,26 +568,33 @@ def fetch_netkeiba_data(driver, year, kai, place, day, race_num):
         
         data[umaban] = {
             "jockey": jockey, 
+            "jockey_full": jockey_full,
             "prev_jockey": prev_jockey, 
+            "past_jockeys": past_jockeys,
             "past": past_str_list, 
             "kinsou_index": float(min(base_score + max_bonus, 10.0))
         }
+    soup.decompose()
     return data
 
 # ==================================================
 # Yahooスポーツナビ 対戦表取得ロジック（★評価ランク対応版）
 # ==================================================
-def fetch_yahoo_matrix_data(driver, year, place, kai, day, race_num, current_distance_str, horse_evals=None):
+def fetch_yahoo_matrix_battles(driver, year, place, kai, day, race_num):
+    """ 対戦表の生データ（2頭以上が出走した過去レース一覧）を取得。失敗時はメッセージ文字列 """
     nk_place = KEIBABOOK_TO_NETKEIBA_PLACE.get(place, "")
     if not nk_place: return "場所コードエラー"
     y_year, y_id = year[-2:], f"{year[-2:]}{nk_place}{kai.zfill(2)}{day.zfill(2)}{race_num.zfill(2)}"
-    url = f"https://sports.yahoo.co.jp/keiba/race/matrix/{y_id}"
-    driver.get(url)
-    try: WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.CLASS_NAME, "hr-tableLeftTop--matrix")))
-    except: return "対戦データ取得タイムアウト"
+    url = f"{YAHOO_URL}/keiba/race/matrix/{y_id}"
+    # Yahooはログイン不要なので、エラーでもレース全体はやり直さない
+    try: outcome = _load_page(driver, "yahoo_matrix", url)
+    except PageLoadError: return "対戦データ取得エラー"
+    if outcome == "timeout": return "対戦データ取得タイムアウト"
+    if outcome == "nodata": return "対戦データなし"
     soup = BeautifulSoup(driver.page_source, "html.parser")
     table = soup.find("table", class_="hr-tableLeftTop--matrix")
-    if not table or not table.thead: return "対戦データなし"
+    if not table or not table.thead:
+        soup.decompose(); return "対戦データなし"
     past_races, header_th_list = [], table.thead.find_all("th")[1:]
     for th in header_th_list:
         link_tag = th.find("a")
@@ -539,178 +614,458 @@ def fetch_yahoo_matrix_data(driver, year, place, kai, day, race_num, current_dis
             rid, rank = past_races[idx]["id"], td.find("span").get_text(strip=True) if td.find("span") else "?"
             if rid not in matrix_data: matrix_data[rid] = {"info": past_races[idx], "results": []}
             matrix_data[rid]["results"].append({"name": horse_name, "rank": rank})
-    valid_battles = sorted([d for d in matrix_data.values() if len(d["results"]) >= 2], key=lambda x: x["info"]["id"], reverse=True)
+    soup.decompose()
+    return sorted([d for d in matrix_data.values() if len(d["results"]) >= 2], key=lambda x: x["info"]["id"], reverse=True)
+
+def format_yahoo_matrix(valid_battles, current_distance_str, horse_evals=None):
+    if isinstance(valid_battles, str): return valid_battles
     if not valid_battles: return "対戦データなし（該当レースなし）"
     current_dist_int, output_lines = extract_distance_int(current_distance_str), ["\n【対戦表】"]
+    grades = ENTITY_INDEX.grades_by_id(horse_evals)
     for battle in valid_battles:
-        info, results = battle["info"], battle["results"]
-        results.sort(key=lambda r: int(re.sub(r"\D", "", r["rank"])) if re.sub(r"\D", "", r["rank"]) else 999)
+        info, results = battle["info"], list(battle["results"])
+        results.sort(key=lambda r: digits_to_int(r["rank"], 999))
         diff = extract_distance_int(info["dist_str"]) - current_dist_int
         res_str_list = []
         for r in results:
-            grade = horse_evals.get(r['name'], "") if horse_evals else ""
+            grade = grades.get(ENTITY_INDEX.horse_id(r['name'], create=False), "")
             suffix = f"({grade})" if grade else ""
             res_str_list.append(f"{r['rank']}着{r['name']}{suffix}")
         output_lines.extend([f"・{info['date'].replace(' ', '')} {info['name']} {info['dist_str']}({diff:+}m)", f"URL：https://race.netkeiba.com/race/result.html?race_id=20{info['id']}", "着順：" + "　".join(res_str_list), ""])
     return "\n".join(output_lines)
 
+def fetch_yahoo_matrix_data(driver, year, place, kai, day, race_num, current_distance_str, horse_evals=None):
+    battles = fetch_yahoo_matrix_battles(driver, year, place, kai, day, race_num)
+    return format_yahoo_matrix(battles, current_distance_str, horse_evals=horse_evals)
+
 # ==================================================
 # Dify Streaming
 # ==================================================
-def stream_dify_workflow(full_text: str):
-    if not DIFY_API_KEY: yield "⚠️ DIFY_API_KEY 未設定"; return
-    payload = {"inputs": {"text": full_text}, "response_mode": "streaming", "user": "keiba-bot"}
-    headers = {"Authorization": f"Bearer {DIFY_API_KEY}", "Content-Type": "application/json"}
+def stream_dify_workflow(full_text: str, cancel_event=None, metrics=None):
+    """ 失敗時は DifyError（キャンセル時は DifyCancelled）を送出 """
+    yield from DIFY_CLIENT.stream_workflow(full_text, cancel_event=cancel_event, metrics=metrics)
+
+# ==================================================
+# キャッシュ経由の取得
+# ==================================================
+def _add_timing(timings, stage: str, t0: float) -> None:
+    if timings is not None: timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - t0)
+
+def _cached_fetch(kind: str, key: str, fetch_fn, valid=bool, timings=None):
+    t0 = time.perf_counter()
     try:
-        res = requests.post("https://api.dify.ai/v1/workflows/run", headers=headers, json=payload, stream=True, timeout=90)
-        for line in res.iter_lines():
-            if not line: continue
-            decoded = line.decode("utf-8").replace("data: ", "")
+        data = PAGE_CACHE.get(kind, key)
+        if data is not None: return data
+        data = fetch_fn()
+        if valid(data): PAGE_CACHE.put(kind, key, data)
+        return data
+    finally:
+        _add_timing(timings, kind, t0)
+
+def _learn_entities(danwa_data=None, nk_data=None, battles=None) -> None:
+    """ 取得済みデータ（キャッシュ分を含む）から騎手・馬名の索引を育てる """
+    for d in (danwa_data or {}).values(): ENTITY_INDEX.horse_id(d.get("name", ""))
+    for n in (nk_data or {}).values():
+        for full in n.get("past_jockeys") or []: ENTITY_INDEX.learn_jockey(full=full)
+        if n.get("prev_jockey"): ENTITY_INDEX.learn_jockey(full=n["prev_jockey"])
+        if n.get("jockey_full"): ENTITY_INDEX.learn_jockey(full=n["jockey_full"], abbr=n.get("jockey"))
+    if isinstance(battles, list):
+        for b in battles:
+            for r in b["results"]: ENTITY_INDEX.horse_id(r["name"])
+
+def _fetch_race_pages(driver, year, kai, place, day, race_num_str, is_shinba=None, timings=None, tabs=None):
+    """ 1レース分のkeibabook/netkeibaページを（キャッシュ優先で）取得。tabs があれば danwa 以外をタブ並列で取る """
+    race_id = f"{year}{kai}{place}{day}{race_num_str}"
+    header_info, danwa_data = _cached_fetch(
+        "danwa", race_id, lambda: fetch_keibabook_danwa(driver, race_id), valid=lambda d: bool(d[1]), timings=timings
+    )
+    if not danwa_data: return None
+
+    race_title = header_info.get("header_text", "")
+    if is_shinba is None: is_shinba = any(x in race_title for x in ["新馬", "メイクデビュー"])
+    cpu_kind = "cpu_shinba" if is_shinba else "cpu"
+    # 名前: (キャッシュ種別, fetch(driver))
+    fetchers = {
+        "cpu": (cpu_kind, lambda d: fetch_keibabook_cpu_data(d, race_id, is_shinba=is_shinba)),
+        "interview": ("syoin", lambda d: fetch_zenkoso_interview(d, race_id)),
+        "chokyo": ("cyokyo", lambda d: fetch_keibabook_chokyo(d, race_id)),
+        "netkeiba": ("netkeiba", lambda d: fetch_netkeiba_data(d, year, kai, place, day, race_num_str)),
+    }
+    pages = {"race_title": race_title, "is_shinba": is_shinba, "danwa": danwa_data}
+    if tabs is None:
+        for name, (kind, fn) in fetchers.items():
+            pages[name] = _cached_fetch(kind, race_id, lambda fn=fn: fn(driver), timings=timings)
+    else:
+        pages.update(tabs.map({
+            name: (lambda tab, kind=kind, fn=fn: _cached_fetch(kind, race_id, lambda: fn(tab), timings=timings))
+            for name, (kind, fn) in fetchers.items()
+        }))
+    _learn_entities(danwa_data, pages["netkeiba"])
+    return pages
+
+def _fetch_yahoo_battles_cached(driver, year, kai, place, day, race_num_str, timings=None):
+    race_id = f"{year}{kai}{place}{day}{race_num_str}"
+    battles = _cached_fetch(
+        "yahoo_matrix", race_id,
+        lambda: fetch_yahoo_matrix_battles(driver, year, place, kai, day, race_num_str),
+        valid=lambda d: isinstance(d, list) and bool(d), timings=timings
+    )
+    _learn_entities(battles=battles)
+    return battles
+
+def prefetch_race(driver, year, kai, place, day, race_num_str, on_progress=None, tabs=None):
+    """ 事前取得用：全ページをキャッシュへ格納するだけ（Difyは呼ばない） """
+    if on_progress: on_progress(status="事前取得中...")
+    t_race, timings = time.perf_counter(), {}
+    pages = _fetch_race_pages(driver, year, kai, place, day, race_num_str, timings=timings, tabs=tabs)
+    if not pages: return None
+    _fetch_yahoo_battles_cached(driver, year, kai, place, day, race_num_str, timings=timings)
+    timings["race_total"] = time.perf_counter() - t_race
+    return {"race_id": f"{year}{kai}{place}{day}{race_num_str}", "race_title": pages["race_title"], "timings": timings}
+
+# ==================================================
+# 1レース分の処理（ワーカースレッドから呼ばれるため st.* は使わない）
+# ==================================================
+def process_race(driver, year, kai, place, day, race_num_str, mode="ai", on_progress=None, cancel_event=None, tabs=None, race_date=None):
+    def report(status=None, partial=None):
+        if on_progress: on_progress(status=status, partial=partial)
+
+    race_id = f"{year}{kai}{place}{day}{race_num_str}"
+    report(status="データ収集中...")
+
+    # 段階別の所要時間（秒）と race_total（実時間）。負荷試験ハーネスが集計する
+    # タブ並列時は段階が重なるので、段階の合計ではなく race_total を見ること
+    t_race, timings = time.perf_counter(), {}
+    pages = _fetch_race_pages(driver, year, kai, place, day, race_num_str, timings=timings, tabs=tabs)
+    if not pages:
+        return None
+
+    race_title = pages["race_title"]
+    is_shinba = pages["is_shinba"]
+    danwa_data = pages["danwa"]
+    cpu_data = pages["cpu"]
+    speed_metrics = compute_speed_metrics(cpu_data)
+    interview_data = pages["interview"]
+    chokyo_data = pages["chokyo"]
+    nk_data = pages["netkeiba"]
+    race_info = extract_race_info(race_title)
+    # 開催日（エクスポートのパーティション）。ページに無ければ事前取得カレンダーの日付
+    race_date = race_info["date"] or race_date
+
+    lines, rows = [], []
+    for umaban in sorted(danwa_data.keys(), key=int):
+        d = danwa_data[umaban]
+        sm = speed_metrics.get(umaban, {})
+        n = nk_data.get(umaban, {})
+        c = cpu_data.get(umaban, {})
+        k = chokyo_data.get(umaban, {"tanpyo": "-", "details": "-"})
+        bias = calculate_baba_bias(int(d["waku"]) if d["waku"].isdigit() else 0, race_title)
+
+        sp_val = sm.get("speed_index", "-")
+        sp_str = f"スピード指数:{sp_val}/35点"
+        kinsou_idx = n.get("kinsou_index", 0.0)
+        fac_str = f"F:{c.get('fac_deashi','-')}/{c.get('fac_kettou','-')}" if is_shinba else f"F:{c.get('fac_crs','-')}/{c.get('fac_dis','-')}"
+
+        # --- ★修正: 騎手乗り替わり判定ロジック ---
+        current_jockey = n.get('jockey', '-')
+        prev_jockey = n.get('prev_jockey', None)
+
+        jockey_changed = bool(prev_jockey and not ENTITY_INDEX.same_jockey(prev_jockey, current_jockey))
+        if jockey_changed:
+            jockey_disp = f"騎手:{current_jockey}←{prev_jockey}"
+        else:
+            jockey_disp = f"騎手:{current_jockey}"
+        # ----------------------------------------
+
+        line = (
+            f"▼{d['waku']}枠{umaban}番 {d['name']} ({jockey_disp})\n"
+            f"【データ】{sp_str} バイアス:{bias['total']} 近走指数:{kinsou_idx:.1f} {fac_str}\n"
+            f"【厩舎】{d['danwa']}\n"
+            f"【前走】{interview_data.get(umaban, 'なし')}\n"
+            f"【調教】{k['tanpyo']} \n{k['details']}\n"
+            f"【近走】{' / '.join(n.get('past', []))}\n"
+        )
+        lines.append(line)
+        rows.append({
+            "race_id": race_id, "mode": mode,
+            "year": year, "kai": kai, "place": place, "day": day, "race_num": int(race_num_str),
+            "race_date": race_date,
+            "race_title": race_title,
+            "distance": int(race_info["distance"]) if race_info["distance"] else None,
+            "track_type": race_info["track_type"], "course_variant": race_info["course_variant"],
+            "is_shinba": is_shinba,
+            "umaban": int(umaban), "waku": int(d["waku"]) if d["waku"].isdigit() else None,
+            "horse_id": ENTITY_INDEX.horse_id(d["name"]),
+            "horse_name": d["name"],
+            "jockey": n.get("jockey"), "prev_jockey": prev_jockey, "jockey_changed": jockey_changed,
+            "sp_best": c.get("sp_best"), "sp_3": c.get("sp_3"), "sp_2": c.get("sp_2"), "sp_last": c.get("sp_last"),
+            "raw_ability": sm.get("raw_ability"), "speed_index": sm.get("speed_index"),
+            "kaisai_bias": bias["kaisai_bias"], "course_bias": bias["course_bias"], "bias_total": bias["total"],
+            "kinsou_index": n.get("kinsou_index"),
+            "fac_crs": c.get("fac_crs"), "fac_dis": c.get("fac_dis"), "fac_zen": c.get("fac_zen"),
+            "fac_deashi": c.get("fac_deashi"), "fac_kettou": c.get("fac_kettou"), "fac_ugoki": c.get("fac_ugoki"),
+            "danwa": d["danwa"], "interview": interview_data.get(umaban),
+            "chokyo_tanpyo": chokyo_data.get(umaban, {}).get("tanpyo"),
+            "chokyo_details": chokyo_data.get(umaban, {}).get("details"),
+            "past_runs": " / ".join(n.get("past", [])),
+            "ai_grade": None,
+        })
+
+    raw_data_block = f"■レース情報\n{race_title}\n\n■各馬詳細\n" + "\n".join(lines)
+    ai_output, ai_error = "", None
+
+    if mode == "info":
+        ai_output = raw_data_block
+        battle_matrix_text = ""
+    else:
+        # 入力が同一ならDify結果を再利用（事前実行分を含む）
+        ai_output = PAGE_CACHE.get("dify", raw_data_block) or ""
+        if ai_output:
+            report(partial=ai_output)
+        else:
+            report(status="AI分析中...")
+            t0 = time.perf_counter()
             try:
-                data = json.loads(decoded)
-                if data.get("event") == "workflow_finished":
-                    for val in data.get("data", {}).get("outputs", {}).values():
-                        if isinstance(val, str): yield val
-                elif "answer" in data: yield data.get("answer", "")
-            except: pass
-    except Exception as e: yield f"Error: {e}"
+                # TTFB 等は DIFY_CLIENT.stats() 側で集計する（timings は段階の合計が実時間になるものだけ）
+                for chunk in stream_dify_workflow(raw_data_block, cancel_event=cancel_event):
+                    ai_output += chunk
+                    report(partial=ai_output)
+                PAGE_CACHE.put("dify", raw_data_block, ai_output)
+            except DifyError as e:
+                # 途中までの出力は残し、失敗はキャッシュしない
+                ai_error = str(e)
+                ai_output = (ai_output + "\n\n" if ai_output else "") + f"⚠️ AI分析エラー: {e}"
+            _add_timing(timings, "dify", t0)
+
+        horse_evals = parse_dify_evaluation(ai_output)
+        grades = ENTITY_INDEX.grades_by_id(horse_evals)
+        for row in rows: row["ai_grade"] = grades.get(row["horse_id"])
+        battle_matrix_text = format_yahoo_matrix(
+            _fetch_yahoo_battles_cached(driver, year, kai, place, day, race_num_str, timings=timings),
+            extract_race_info(race_title).get("distance", ""),
+            horse_evals=horse_evals
+        )
+
+    timings["race_total"] = time.perf_counter() - t_race
+    return {
+        "race_id": race_id,
+        "race_title": race_title,
+        "raw_data_block": raw_data_block,
+        "ai_output": ai_output,
+        "ai_error": ai_error,
+        "battle_matrix_text": battle_matrix_text,
+        "final_output": ai_output + "\n\n" + battle_matrix_text,
+        "rows": rows,
+        "timings": timings,
+    }
+
+# ==================================================
+# 共有ジョブキュー（全セッション共通・Chrome数を固定）
+# ==================================================
+MAX_WORKERS = int(_secret("MAX_WORKERS", 2))
+
+# メモリ上限モード：完了レースはディスクへ退避し、メモリには要約だけ残す
+MEMORY_BOUNDED = bool(_secret("MEMORY_BOUNDED", False))
+RESULT_DIR = os.path.join(CACHE_DIR, "results")
+# ブラウザ(chromedriver+Chrome)のRSSがこれを超えたらレース間で作り直す（0で無効）
+BROWSER_RSS_LIMIT_MB = int(_secret("BROWSER_RSS_LIMIT_MB", 800 if MEMORY_BOUNDED else 0))
+RESULT_TTL_SEC = int(_secret("RESULT_TTL_SEC", 1800))
+# 1ワーカーのChrome内で並列に使うタブ数（1で従来どおり1タブ逐次）
+BROWSER_TABS = int(_secret("BROWSER_TABS", 1))
+
+# 事前取得スケジュール（secrets.toml の [[WARMUP_CALENDAR]] / WARMUP_TIMES）
+WARMUP_CALENDAR = _secret("WARMUP_CALENDAR", [])
+WARMUP_TIMES = _secret("WARMUP_TIMES", [])
+WARMUP_PRERUN_AI = bool(_secret("WARMUP_PRERUN_AI", False))
+
+def _release_driver(state: dict) -> None:
+    tabs = state.pop("tabs", None)
+    if tabs is not None: tabs.close()
+    driver = state.pop("driver", None)
+    if driver is None: return
+    try: driver.quit()
+    except: pass
+
+def _browser_rss_mb(driver) -> float:
+    try: return process_tree_rss_mb(driver.service.process.pid)
+    except Exception: return 0.0
+
+def _spool_result(result: dict, mode: str) -> dict:
+    """ 全文をファイルへ書き出し、メモリ上の結果は表示に必要な要約だけにする """
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    path = os.path.join(RESULT_DIR, f"{result['race_id']}_{mode}.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(result["final_output"])
+    return {
+        "race_id": result["race_id"],
+        "race_title": result["race_title"],
+        "ai_error": result.get("ai_error"),
+        "timings": result.get("timings", {}),
+        "export_paths": result.get("export_paths", []),
+        "output_path": path,
+    }
+
+def load_output(entry: dict) -> str:
+    """ 結果エントリの全文（退避済みならファイルから読む） """
+    if entry.get("final_output") is not None: return entry["final_output"]
+    path = entry.get("output_path")
+    if not path: return ""
+    try:
+        with open(path, encoding="utf-8") as f: return f.read()
+    except OSError:
+        return ""
+
+def _race_worker(task, state: dict):
+    p = task.params
+    max_retries = 2
+    for attempt in range(max_retries):
+        try:
+            if state.get("driver") is None:
+                task.update(status=f"ログイン処理中 (試行 {attempt+1}/{max_retries})...")
+                driver = build_driver()
+                state["driver"] = driver
+                login_keibabook(driver)
+                # ログイン後にタブを開くのでCookieは共有済み
+                if BROWSER_TABS > 1: state["tabs"] = TabPool(driver, BROWSER_TABS)
+            tabs = state.get("tabs")
+            # タブ併用時は元のタブも BrowserTab 経由で操作する（WebDriverコマンドの直列化のため）
+            driver = tabs.main if tabs else state["driver"]
+            if p["mode"] == "prefetch":
+                return prefetch_race(
+                    driver, p["year"], p["kai"], p["place"], p["day"], p["race_num_str"],
+                    on_progress=task.update, tabs=tabs
+                )
+            result = process_race(
+                driver, p["year"], p["kai"], p["place"], p["day"], p["race_num_str"],
+                mode=p["mode"], on_progress=task.update, cancel_event=task.cancelled, tabs=tabs,
+                race_date=p.get("race_date")
+            )
+            break
+        except Exception as e:
+            # タイムアウトなどのエラー時はブラウザを作り直して再試行
+            _release_driver(state)
+            if attempt < max_retries - 1:
+                task.update(status=f"接続エラーのため再試行します... ({e})")
+                time.sleep(2)
+                continue
+            raise
+
+    try: ENTITY_INDEX.save()
+    except OSError: pass
+
+    # レース完了ごとに特徴量を追記（共有タスクなので1レース1回だけ書かれる）
+    if result:
+        try: result["export_paths"] = FEATURE_EXPORTER.write_race(result["rows"])
+        except Exception as e: task.update(status=f"エクスポート失敗: {e}")
+        if MEMORY_BOUNDED and "final_output" in result:
+            result = _spool_result(result, p["mode"])
+
+    if MEMORY_BOUNDED:
+        # 解析木などの循環参照をここで回収しておく
+        gc.collect()
+    driver = state.get("driver")
+    if BROWSER_RSS_LIMIT_MB and driver is not None and _browser_rss_mb(driver) > BROWSER_RSS_LIMIT_MB:
+        _release_driver(state)
+    return result
+
+@st.cache_resource
+def get_job_queue() -> RaceJobQueue:
+    return RaceJobQueue(_race_worker, num_workers=MAX_WORKERS, result_ttl=RESULT_TTL_SEC, on_idle=_release_driver)
+
+def submit_race(jq: RaceJobQueue, year, kai, place, day, r: int, mode: str, race_date=None):
+    kai, place, day = str(kai).zfill(2), str(place).zfill(2), str(day).zfill(2)
+    race_num_str = f"{r:02}"
+    params = {"year": str(year), "kai": kai, "place": place, "day": day, "race_num_str": race_num_str, "mode": mode,
+              "race_date": race_date}
+    return jq.submit((f"{year}{kai}{place}{day}{race_num_str}", mode), params)
+
+@st.cache_resource
+def get_warmup_scheduler() -> WarmupScheduler:
+    jq = get_job_queue()
+    def submit(card, r, mode):
+        submit_race(jq, card["year"], card["kai"], card["place"], card["day"], r, mode, race_date=card.get("date"))
+    calendar = [dict(c) for c in WARMUP_CALENDAR]
+    return WarmupScheduler(submit, calendar, list(WARMUP_TIMES), prerun_ai=WARMUP_PRERUN_AI).start()
 
 # ==================================================
 # Main Execution (Batch)
 # ==================================================
 def run_batch_prediction(jobs_config, mode="ai"):
-    full_output_log = ""
+    """
+    全レースを共有キューへ投入し、進行中の1レースだけを逐次描画する。
+    戻り値はレース毎の結果リスト（表示は app.py 側でページ送り）。
+    """
+    jq = get_job_queue()
+
+    # 先に全レースを共有キューへ投入（同一レース・同一モードは他セッションと共有）
+    submitted = []
     for job_idx, job in enumerate(jobs_config):
-        
-        # --- ★ここからリトライループの開始 ---
-        max_retries = 2
-        for attempt in range(max_retries):
-            driver = build_driver()
-            try:
-                st.info(f"[{job_idx+1}/{len(jobs_config)}] ログイン処理中 (試行 {attempt+1}/{max_retries})...")
-                login_keibabook(driver)
-                
-                year = job["year"]
-                kai = str(job["kai"]).zfill(2)
-                place = str(job["place"]).zfill(2)
-                day = str(job["day"]).zfill(2)
-                place_name = job["place_name"]
-                base_id = f"{year}{kai}{place}{day}"
-                
-                st.markdown(f"## 🏁 {place_name}開催")
-                full_output_log += f"\n\n--- {place_name} ---\n"
-
-                # 指定されたレースをすべて処理するループ
-                for r in sorted(job["races"]):
-                    race_num_str = f"{r:02}"
-                    race_id = base_id + race_num_str
-                    st.markdown(f"### {place_name} {r}R")
-                    status = st.empty()
-                    status.text("データ収集中...")
-                    
-                    header_info, danwa_data = fetch_keibabook_danwa(driver, race_id)
-                    if not danwa_data:
-                        st.error(f"データ取得失敗: {race_id}")
-                        continue
-                    
-                    race_title = header_info.get("header_text", "")
-                    is_shinba = any(x in race_title for x in ["新馬", "メイクデビュー"])
-                    
-                    cpu_data = fetch_keibabook_cpu_data(driver, race_id, is_shinba=is_shinba)
-                    speed_metrics = compute_speed_metrics(cpu_data)
-                    interview_data = fetch_zenkoso_interview(driver, race_id)
-                    chokyo_data = fetch_keibabook_chokyo(driver, race_id)
-                    nk_data = fetch_netkeiba_data(driver, year, kai, place, day, race_num_str)
-                    
-                    lines = []
-                    for umaban in sorted(danwa_data.keys(), key=int):
-                        d = danwa_data[umaban]
-                        sm = speed_metrics.get(umaban, {})
-                        n = nk_data.get(umaban, {})
-                        c = cpu_data.get(umaban, {})
-                        k = chokyo_data.get(umaban, {"tanpyo": "-", "details": "-"})
-                        bias = calculate_baba_bias(int(d["waku"]) if d["waku"].isdigit() else 0, race_title)
-                        
-                        sp_val = sm.get("speed_index", "-")
-                        sp_str = f"スピード指数:{sp_val}/35点"
-                        kinsou_idx = n.get("kinsou_index", 0.0)
-                        fac_str = f"F:{c.get('fac_deashi','-')}/{c.get('fac_kettou','-')}" if is_shinba else f"F:{c.get('fac_crs','-')}/{c.get('fac_dis','-')}"
-                        
-                        # --- ★修正: 騎手乗り替わり判定ロジック ---
-                        current_jockey = n.get('jockey', '-')
-                        prev_jockey = n.get('prev_jockey', None)
-                        
-                        # 同一人物判定関数
-                        def is_same_jockey(prev_full, curr_abbr):
-                            if not prev_full or not curr_abbr: return False
-                            p = prev_full.replace(" ", "").replace("　", "")
-                            c = curr_abbr.replace(" ", "").replace("　", "")
-                            # 完全一致の場合
-                            if p == c: return True
-                            # 略称が前走騎手名(フルネーム)の先頭と一致する場合 (例: 原 ← 原優介, 横山武 ← 横山武史)
-                            # 現在の騎手名が1文字以上ある場合のみチェック
-                            if len(c) > 0 and p.startswith(c):
-                                return True
-                            return False
-
-                        if prev_jockey and not is_same_jockey(prev_jockey, current_jockey):
-                            jockey_disp = f"騎手:{current_jockey}←{prev_jockey}"
-                        else:
-                            jockey_disp = f"騎手:{current_jockey}"
-                        # ----------------------------------------
-
-                        line = (
-                            f"▼{d['waku']}枠{umaban}番 {d['name']} ({jockey_disp})\n"
-                            f"【データ】{sp_str} バイアス:{bias['total']} 近走指数:{kinsou_idx:.1f} {fac_str}\n"
-                            f"【厩舎】{d['danwa']}\n"
-                            f"【前走】{interview_data.get(umaban, 'なし')}\n"
-                            f"【調教】{k['tanpyo']} \n{k['details']}\n"
-                            f"【近走】{' / '.join(n.get('past', []))}\n"
-                        )
-                        lines.append(line)
-
-                    raw_data_block = f"■レース情報\n{race_title}\n\n■各馬詳細\n" + "\n".join(lines)
-                    result_area = st.empty()
-                    ai_output = ""
-
-                    if mode == "info":
-                        ai_output = raw_data_block
-                        result_area.text_area(f"{r}R データ", ai_output, height=400)
-                        battle_matrix_text = ""
-                    else:
-                        status.text("AI分析中...")
-                        for chunk in stream_dify_workflow(raw_data_block):
-                            ai_output += chunk
-                            result_area.markdown(ai_output + "▌")
-                        
-                        horse_evals = parse_dify_evaluation(ai_output)
-                        battle_matrix_text = fetch_yahoo_matrix_data(
-                            driver, year, place, kai, day, race_num_str, 
-                            extract_race_info(race_title).get("distance", ""), 
-                            horse_evals=horse_evals
-                        )
-
-                    final_output = ai_output + "\n\n" + battle_matrix_text
-                    result_area.markdown(final_output)
-                    
-                    full_output_log += f"\n{race_title}\n{final_output}\n"
-                    render_copy_button(final_output, f"{r}Rコピー", f"cp_{base_id}_{r}")
-                    status.success("完了")
-
-                # --- ★全てのレース(1R~3R等)が正常に終われば、リトライループを抜ける ---
-                break
-
-            except Exception as e:
-                # タイムアウトなどのエラーが発生した場合
-                if attempt < max_retries - 1:
-                    st.warning(f"接続エラーのため再試行します... ({e})")
-                    driver.quit()
-                    time.sleep(2)
-                    continue # 次の attempt (試行) へ
-                else:
-                    st.error(f"エラーが発生しました: {e}")
-            finally:
-                driver.quit()
-        # --- ★リトライループ終了 ---
-
-    return full_output_log
+        year = job["year"]
+        kai = str(job["kai"]).zfill(2)
+        place = str(job["place"]).zfill(2)
+        day = str(job["day"]).zfill(2)
+        for r in sorted(job["races"]):
+            submitted.append((job_idx, job, f"{year}{kai}{place}{day}", r, submit_race(jq, year, kai, place, day, r, mode)))
+
+    progress = st.progress(0.0)
+    done_area = st.empty()
+    status = st.empty()
+    live_area = st.empty()
+
+    # ピークRSS（このプロセスとワーカーのChromeを含む）を実行単位で計測
+    wait_before = PAGE_WAITER.total_wait_sec()
+    results, done_lines = [], []
+    with PeakRssMonitor(interval=1.0) as monitor:
+        for i, (job_idx, job, base_id, r, task) in enumerate(submitted):
+            place_name = job["place_name"]
+            label = f"{place_name} {r}R"
+
+            # 共有タスクの進捗をポーリングし、進行中レースだけ描画（変化があった時だけ送る）
+            shown_status, shown_partial = None, ""
+            while not task.done.wait(0.3):
+                if task.status != shown_status:
+                    shown_status = task.status
+                    status.text(f"[{i+1}/{len(submitted)}] {label}: {shown_status}")
+                partial = task.partial
+                if partial and partial != shown_partial:
+                    shown_partial = partial
+                    live_area.markdown(partial + "▌")
+            # 前のレースの途中出力を次のレースへ持ち越さない
+            if shown_partial: live_area.empty()
+
+            entry = {"job_idx": job_idx, "place_name": place_name, "race_num": r, "mode": mode,
+                     "race_id": f"{base_id}{r:02}", "race_title": "", "final_output": "", "error": None}
+            if task.error is not None:
+                entry["error"] = f"エラーが発生しました: {task.error}"
+            elif not task.result:
+                entry["error"] = f"データ取得失敗: {base_id}{r:02}"
+            else:
+                entry["race_title"] = task.result["race_title"]
+                # メモリ上限モードでは全文を持たず、退避先パスだけを保持する
+                entry["final_output"] = task.result.get("final_output")
+                entry["output_path"] = task.result.get("output_path")
+            results.append(entry)
+
+            summary = entry["error"] or entry["race_title"].split("\n")[0]
+            done_lines.append(f"- {'⚠️' if entry['error'] else '✅'} {label} {summary}")
+            done_area.markdown("\n".join(done_lines))
+            progress.progress((i + 1) / len(submitted))
+
+    status.empty()
+    live_area.empty()
+    # ページ待機時間は他セッションの処理も含む（共有ワーカーのため）
+    st.caption(f"ピークRSS（Chrome含む）: {monitor.peak_mb:.0f} MB / ページ待機合計: {PAGE_WAITER.total_wait_sec() - wait_before:.1f} 秒")
+    return results
+
+def iter_combined_output(results):
+    """ 結果リストから従来形式の全文テキストを1レースずつ返す """
+    current_job = None
+    for x in results:
+        if x["job_idx"] != current_job:
+            current_job = x["job_idx"]
+            yield f"\n\n--- {x['place_name']} ---\n"
+        if x["error"]: continue
+        yield f"\n{x['race_title']}\n{load_output(x)}\n"
+
+def combine_outputs(results) -> str:
+    return "".join(iter_combined_output(results))
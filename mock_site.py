@@ -0,0 +1,318 @@
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==================================================
+# 負荷試験用のローカル模擬サイト
+# ==================================================
+# keibabook / netkeiba / Yahoo / Dify(workflows/run SSE) のURLパターンを1つのサーバで提供する。
+# 記録済みページがあればそれを返し、無ければ各 fetch_* が解析できる合成ページを返す。
+#   {record_dir}/{kind}/{page_id}.html  →  {record_dir}/{kind}/default.html  →  合成ページ
+# kind: login / danwa / cyokyo / syoin / cpu / netkeiba / yahoo_matrix
+
+PLACE_NAMES = {
+    "00": "京都", "01": "阪神", "02": "中京", "03": "小倉", "04": "東京",
+    "05": "中山", "06": "福島", "07": "新潟", "08": "札幌", "09": "函館",
+}
+
+ROUTES = [
+    ("danwa", re.compile(r"^/cyuou/danwa/0/(\d{12})$")),
+    ("cyokyo", re.compile(r"^/cyuou/cyokyo/0/(\d{12})$")),
+    ("syoin", re.compile(r"^/cyuou/syoin/(\d{12})$")),
+    ("cpu", re.compile(r"^/cyuou/cpu/(\d{12})$")),
+    ("netkeiba", re.compile(r"^/race/shutuba_past\.html$")),
+    ("yahoo_matrix", re.compile(r"^/keiba/race/matrix/(\d{10})$")),
+]
+
+
+class MockConfig:
+    def __init__(self, record_dir=None, latency_ms=200, jitter_ms=100, error_rate=0.0,
+                 horses=16, dify_ttfb_ms=1500, dify_chunks=20, dify_chunk_ms=100,
+                 dify_error_rate=0.0, multiline_sse=False, seed=None):
+        self.record_dir = record_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.horses = horses
+        self.dify_ttfb_ms = dify_ttfb_ms
+        self.dify_chunks = dify_chunks
+        self.dify_chunk_ms = dify_chunk_ms
+        self.dify_error_rate = dify_error_rate
+        self.multiline_sse = multiline_sse
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def delay(self, base_ms):
+        with self.lock: j = self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(base_ms + j, 0) / 1000.0)
+
+    def roll(self, rate) -> bool:
+        with self.lock: return self.rng.random() < rate
+
+    def count(self, kind):
+        with self.lock: self.counts[kind] = self.counts.get(kind, 0) + 1
+
+# --------------------------------------------------
+# 合成ページ
+# --------------------------------------------------
+def _horse_name(umaban: int) -> str:
+    return f"モックホース{umaban}"
+
+def _race_parts(race_id: str):
+    """ keibabook形式 race_id (YYYYKKPPDDRR) を分解 """
+    return race_id[:4], race_id[4:6], race_id[6:8], race_id[8:10], int(race_id[10:12])
+
+def _race_title(race_id: str) -> list:
+    year, kai, place, day, r = _race_parts(race_id)
+    track = "芝" if r % 2 else "ダート"
+    name = "2歳新馬" if r % 6 == 1 else f"モック{r}ステークス"
+    return [f"{year}年10月{min(int(day), 28)}日", f"{int(kai)}回{PLACE_NAMES.get(place, '東京')}{int(day)}日目", f"{r}R {name} {track}1600m"]
+
+def page_login(_id, cfg):
+    return (
+        '<html><body><form method="post" action="/login/login">'
+        '<input type="text" name="login_id"><input type="password" name="pswd">'
+        '<input type="submit" value="ログイン" class="btn-login"></form></body></html>'
+    )
+
+def page_danwa(race_id, cfg):
+    rows = []
+    for u in range(1, cfg.horses + 1):
+        waku = min((u + 1) // 2, 8)
+        rows.append(
+            f'<tr><td class="waku"><p class="waku{waku}">{waku}</p></td><td class="umaban">{u}</td>'
+            f'<td class="left">{_horse_name(u)}</td></tr>'
+            f'<tr><td class="danwa" colspan="3">状態は良好。{u}番は前走より上積みがある。</td></tr>'
+            '<tr class="spacer"><td></td></tr>'
+        )
+    title = "".join(f"<p>{t}</p>" for t in _race_title(race_id))
+    return (f'<html><body><div class="racetitle">{title}</div>'
+            f'<table class="default danwa"><tbody>{"".join(rows)}</tbody></table></body></html>')
+
+def page_cyokyo(race_id, cfg):
+    tables = []
+    for u in range(1, cfg.horses + 1):
+        tables.append(
+            f'<table class="cyokyo"><tr><td class="umaban">{u}</td><td class="tanpyo">動き上々</td></tr>'
+            '<tr><td colspan="5"><dl class="dl-table"><dt>助手</dt><dt>美Ｗ良</dt></dl>'
+            '<table class="cyokyodata"><tr class="time"><td>67.5</td><td>52.3</td><td>38.0</td><td>11.9</td></tr>'
+            '<tr class="awase"><td>僚馬を0.2秒追走同入</td></tr></table></td></tr></table>'
+        )
+    return f'<html><body>{"".join(tables)}</body></html>'
+
+def page_syoin(race_id, cfg):
+    if _race_parts(race_id)[4] % 6 == 1:
+        return '<html><body><div class="main"><p>データがありません</p></div></body></html>'
+    rows = []
+    for u in range(1, cfg.horses + 1):
+        rows.append(
+            f'<tr><td class="umaban">{u}</td></tr>'
+            f'<tr><td class="syoin"><div class="syoindata">前走 {u}着</div>道中スムーズ。直線も伸びていた。</td></tr>'
+        )
+    return f'<html><body><table class="default syoin"><tbody>{"".join(rows)}</tbody></table></body></html>'
+
+def page_cpu(race_id, cfg):
+    speed, factor = [], []
+    for u in range(1, cfg.horses + 1):
+        base = 80 + (u * 7) % 25
+        speed.append(
+            f'<tr><td class="umaban">{u}</td><td>{_horse_name(u)}</td><td>-</td><td>-</td>'
+            f'<td>{base + 10}</td><td>{base - 3}</td><td>{base}</td><td>{base + 2}</td></tr>'
+        )
+        marks = "".join(f"<td><p>{m}</p></td>" for m in ["◎", "○", "▲", "△"])
+        factor.append(f'<tr><td class="umaban">{u}</td><td>-</td><td>-</td><td>-</td><td>-</td>{marks}</tr>')
+    return (
+        '<html><body><div class="main">'
+        f'<table id="cpu_speed_sort_table"><tbody>{"".join(speed)}</tbody></table>'
+        f'<table><caption>ファクター</caption><tbody>{"".join(factor)}</tbody></table>'
+        '</div></body></html>'
+    )
+
+def page_netkeiba(_id, cfg):
+    rows = []
+    for u in range(1, cfg.horses + 1):
+        past = "".join(
+            '<td class="Past"><div class="Data01">2026.09.0{0} 中山</div><div class="Data02">モック特別 芝1600</div>'
+            '<span class="Num">{1}</span><div class="Data03">16頭 {2}番 3人 横山武史 57.0</div>'
+            '<div class="Data06">8-6-3 (34.5)</div></td>'.format(i + 1, (u + i) % 10 + 1, u)
+            for i in range(3)
+        )
+        rows.append(
+            f'<tr class="HorseList"><td class="Waku">{u}</td><td class="Jockey"><a>横山武</a> 57.0</td>{past}</tr>'
+        )
+    return f'<html><body><table class="Shutuba_Past5_Table">{"".join(rows)}</table></body></html>'
+
+def page_yahoo_matrix(_id, cfg):
+    heads = "".join(
+        f'<th><a href="/keiba/race/result/2606010{i}11">モック対戦{i}</a>'
+        f'<span class="hr-tableLeftTop__item hr-tableLeftTop__item--date">2026 9/{i}</span>'
+        f'<span class="hr-tableLeftTop__item">芝{1400 + 200 * i}m</span></th>'
+        for i in range(1, 4)
+    )
+    rows = []
+    for u in range(1, cfg.horses + 1):
+        cells = "".join(f"<td><span>{(u + i) % 12 + 1}</span></td>" if (u + i) % 3 else "<td>-</td>" for i in range(1, 4))
+        rows.append(f"<tr><th><a>{_horse_name(u)}</a></th>{cells}</tr>")
+    return (f'<html><body><table class="hr-tableLeftTop--matrix"><thead><tr><th></th>{heads}</tr></thead>'
+            f'<tbody>{"".join(rows)}</tbody></table></body></html>')
+
+SYNTHETIC_PAGES = {
+    "login": page_login, "danwa": page_danwa, "cyokyo": page_cyokyo, "syoin": page_syoin,
+    "cpu": page_cpu, "netkeiba": page_netkeiba, "yahoo_matrix": page_yahoo_matrix,
+}
+
+def dify_answer(input_text: str) -> str:
+    """ 入力ブロックの馬名から parse_dify_evaluation が読めるMarkdown表を作る """
+    names = re.findall(r"▼\d+枠(\d+)番 (\S+)", input_text)
+    lines = ["| 馬番 | 馬名 | 根拠 | 展開 | 評価 |", "|---|---|---|---|---|"]
+    for umaban, name in names:
+        lines.append(f"| {umaban} | {name} | モック | 中団 | {'SABCDE'[int(umaban) % 6]} |")
+    return "## 予想（モック）\n\n" + "\n".join(lines) + "\n"
+
+# --------------------------------------------------
+# HTTPハンドラ
+# --------------------------------------------------
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    cfg: MockConfig = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body: str, ctype="text/html; charset=utf-8", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _recorded(self, kind, page_id):
+        if not self.cfg.record_dir: return None
+        for name in (page_id, "default"):
+            path = os.path.join(self.cfg.record_dir, kind, f"{name}.html")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f: return f.read()
+        return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/login/login":
+            kind, page_id = "login", "login"
+        else:
+            for kind, pattern in ROUTES:
+                m = pattern.match(url.path)
+                if m: break
+            else:
+                return self._send(404, "<html><body>Not Found</body></html>")
+            page_id = m.group(1) if m.groups() else parse_qs(url.query).get("race_id", [""])[0]
+
+        self.cfg.count(kind)
+        self.cfg.delay(self.cfg.latency_ms)
+        if self.cfg.roll(self.cfg.error_rate):
+            return self._send(500, "<html><body><h1>500 Internal Server Error</h1></body></html>")
+        body = self._recorded(kind, page_id) or SYNTHETIC_PAGES[kind](page_id, self.cfg)
+        self._send(200, body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        path = urlparse(self.path).path
+        if path == "/login/login":
+            self.cfg.count("login_post")
+            return self._send(302, "", headers={"Location": "/", "Set-Cookie": "mock_session=1; Path=/"})
+        if path.endswith("/workflows/run"):
+            return self._dify(raw)
+        self._send(404, "Not Found")
+
+    def _dify(self, raw: bytes):
+        cfg = self.cfg
+        cfg.count("dify")
+        cfg.delay(cfg.dify_ttfb_ms)
+        if cfg.roll(cfg.dify_error_rate):
+            code = 429 if cfg.roll(0.5) else 503
+            return self._send(code, json.dumps({"code": "mock_error", "status": code}), ctype="application/json")
+        try: text = json.loads(raw.decode("utf-8") or "{}").get("inputs", {}).get("text", "")
+        except ValueError: text = ""
+        answer = dify_answer(text)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def emit(obj):
+            if cfg.multiline_sse:
+                payload = "".join(f"data: {line}\n" for line in json.dumps(obj, ensure_ascii=False, indent=1).split("\n"))
+            else:
+                payload = f"data: {json.dumps(obj, ensure_ascii=False)}\n"
+            write_chunk((payload + "\n").encode("utf-8"))
+
+        try:
+            emit({"event": "workflow_started", "data": {}})
+            step = max(1, len(answer) // max(cfg.dify_chunks, 1))
+            for i in range(0, len(answer), step):
+                emit({"event": "text_chunk", "data": {"text": answer[i:i + step]}})
+                write_chunk(b"event: ping\n\n")
+                time.sleep(cfg.dify_chunk_ms / 1000.0)
+            emit({"event": "workflow_finished", "data": {"status": "succeeded", "outputs": {"text": answer}}})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def start_mock_site(cfg: MockConfig, host="127.0.0.1", port=0):
+    """ 別スレッドで起動し (server, base_url) を返す。port=0 で空きポート """
+    handler = type("BoundMockHandler", (MockHandler,), {"cfg": cfg})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-site", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="UMAI 負荷試験用の模擬サイト")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--record-dir", default=None)
+    ap.add_argument("--latency-ms", type=float, default=200)
+    ap.add_argument("--jitter-ms", type=float, default=100)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--horses", type=int, default=16)
+    ap.add_argument("--dify-ttfb-ms", type=float, default=1500)
+    ap.add_argument("--dify-chunks", type=int, default=20)
+    ap.add_argument("--dify-chunk-ms", type=float, default=100)
+    ap.add_argument("--dify-error-rate", type=float, default=0.0)
+    ap.add_argument("--multiline-sse", action="store_true")
+    args = ap.parse_args()
+
+    cfg = MockConfig(
+        record_dir=args.record_dir, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, horses=args.horses, dify_ttfb_ms=args.dify_ttfb_ms,
+        dify_chunks=args.dify_chunks, dify_chunk_ms=args.dify_chunk_ms,
+        dify_error_rate=args.dify_error_rate, multiline_sse=args.multiline_sse,
+    )
+    server, base = start_mock_site(cfg, args.host, args.port)
+    print(f"mock site: {base}  (BASE_URL / NETKEIBA_URL / YAHOO_URL = {base}, DIFY_API_URL = {base}/v1)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
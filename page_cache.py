@@ -0,0 +1,47 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# ==================================================
+# 解析済みページのローカルキャッシュ
+# ==================================================
+# fetch_* の解析結果を (kind, key) 単位で JSON として保存する。
+# 空の結果（取得失敗）は保存しない。
+
+class PageCache:
+    def __init__(self, root=".umai_cache", ttl=6 * 3600):
+        self.root = root
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, kind: str, key: str) -> str:
+        safe_key = key if key.isalnum() else hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, kind, f"{safe_key}.json")
+
+    def get(self, kind: str, key: str):
+        path = self._path(kind, key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if time.time() - entry.get("saved_at", 0) > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.get("data")
+
+    def put(self, kind: str, key: str, data) -> None:
+        if not data: return
+        path = self._path(kind, key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"saved_at": time.time(), "data": data}, f, ensure_ascii=False)
+            os.replace(tmp, path)
@@ -0,0 +1,137 @@
+import time
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+# ==================================================
+# ページ種別ごとの読み込み完了判定（固定タイムアウトの置き換え）
+# ==================================================
+# 目的の要素が出たら ready、「データなし」「エラー」表示を見つけたら即終了する。
+# 表が無いのが普通にあり得るページ（optional: 新馬戦の前走コメント等）だけは、
+# DOM読み込み完了後 settle 秒で nodata とする。それ以外はJSでの遅延描画に備えて
+# タイムアウトまで待つ。タイムアウトはホストごとの実測ロード時間の p95 から決める。
+# 文言の照合は innerText（表示テキスト）に対して行い、<script> 内の文字列には反応しない。
+
+class PageLoadError(Exception):
+    """ エラーページ・ログインフォーム（セッション切れ）を検出した """
+
+class PageSpec:
+    def __init__(self, ready, timeout, nodata_text=(), error_text=(), error_css=(), optional=False, settle=0.5):
+        self.ready = ready
+        self.timeout = timeout
+        self.nodata_text = list(nodata_text)
+        self.error_text = list(error_text)
+        self.error_css = list(error_css)
+        self.optional = optional
+        self.settle = settle
+
+COMMON_NODATA = ["データがありません", "データはありません", "該当するデータ", "公開されていません", "準備中"]
+COMMON_ERROR = ["ページが見つかりません", "Not Found", "Internal Server Error", "Service Unavailable",
+                "エラーが発生しました", "アクセスが集中"]
+# keibabook はセッション切れだとログインフォームが出る
+KEIBABOOK_ERROR_CSS = ["input[name='login_id']"]
+
+PAGE_SPECS = {
+    "danwa": PageSpec("table.default.danwa", 10, COMMON_NODATA, COMMON_ERROR, KEIBABOOK_ERROR_CSS),
+    "cyokyo": PageSpec("table.cyokyo", 10, COMMON_NODATA, COMMON_ERROR, KEIBABOOK_ERROR_CSS),
+    "syoin": PageSpec("table.default.syoin", 10, COMMON_NODATA, COMMON_ERROR, KEIBABOOK_ERROR_CSS, optional=True),
+    "cpu": PageSpec("#cpu_speed_sort_table, .main table", 10, COMMON_NODATA, COMMON_ERROR, KEIBABOOK_ERROR_CSS),
+    "netkeiba": PageSpec(".Shutuba_Past5_Table", 5, COMMON_NODATA + ["出馬表は確定していません"], COMMON_ERROR),
+    "yahoo_matrix": PageSpec(".hr-tableLeftTop--matrix", 5, COMMON_NODATA + ["対戦成績はありません"], COMMON_ERROR),
+}
+
+# 1回の execute_script で状態を判定する
+PROBE_JS = """
+var ready = arguments[0], nodata = arguments[1], errText = arguments[2], errCss = arguments[3];
+if (document.querySelector(ready)) return "ready";
+for (var i = 0; i < errCss.length; i++) if (document.querySelector(errCss[i])) return "error";
+var body = document.body;
+if (!body) return "loading";
+var text = body.innerText || "";
+for (var i = 0; i < errText.length; i++) if (text.indexOf(errText[i]) >= 0) return "error";
+for (var i = 0; i < nodata.length; i++) if (text.indexOf(nodata[i]) >= 0) return "nodata";
+return document.readyState === "loading" ? "loading" : "loaded";
+"""
+
+def probe_page(driver, spec: PageSpec) -> str:
+    """ ready / nodata / error / loaded(DOM完了・要素なし) / loading """
+    try: return driver.execute_script(PROBE_JS, spec.ready, spec.nodata_text, spec.error_text, spec.error_css) or "loading"
+    except Exception: return "loading"
+
+
+class PageWaiter:
+    def __init__(self, poll_sec=0.1, min_samples=20, p95_factor=2.0, min_timeout=2.0, max_factor=2.0):
+        self.poll_sec = poll_sec
+        self.min_samples = min_samples
+        self.p95_factor = p95_factor
+        self.min_timeout = min_timeout
+        self.max_factor = max_factor
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._stats = {}
+        self._defaults = {}
+
+    # --------------------------------------------------
+    # ホストごとの学習
+    # --------------------------------------------------
+    def _percentile(self, host, pct):
+        vals = sorted(self._samples.get(host, ()))
+        if not vals: return None
+        return vals[min(len(vals) - 1, int(pct * len(vals)))]
+
+    def timeout_for(self, host: str, default: float) -> float:
+        with self._lock:
+            if len(self._samples.get(host, ())) < self.min_samples: return default
+            p95 = self._percentile(host, 0.95)
+        return min(max(p95 * self.p95_factor, self.min_timeout), default * self.max_factor)
+
+    def record(self, host: str, outcome: str, elapsed: float, waited: float) -> None:
+        with self._lock:
+            if outcome == "ready":
+                self._samples.setdefault(host, deque(maxlen=200)).append(elapsed)
+            st = self._stats.setdefault(host, {"pages": 0, "wait_sec": 0.0, "ready": 0, "nodata": 0, "error": 0, "timeout": 0})
+            st["pages"] += 1
+            st["wait_sec"] += waited
+            st[outcome] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {}
+            for host, st in self._stats.items():
+                out[host] = dict(st, p50_sec=self._percentile(host, 0.5), p95_sec=self._percentile(host, 0.95))
+        for host, st in out.items():
+            st["timeout_sec"] = self.timeout_for(host, self._defaults.get(host, 10))
+        return out
+
+    def total_wait_sec(self) -> float:
+        with self._lock: return sum(st["wait_sec"] for st in self._stats.values())
+
+    # --------------------------------------------------
+    # 待機
+    # --------------------------------------------------
+    def wait(self, driver, page_type: str, url: str, started_at: float) -> str:
+        """ driver.get 済みのページの完了を待ち、ready / nodata / error / timeout を返す """
+        spec = PAGE_SPECS[page_type]
+        host = urlparse(url).netloc
+        self._defaults.setdefault(host, spec.timeout)
+        t_wait = time.perf_counter()
+        deadline = started_at + self.timeout_for(host, spec.timeout)
+        loaded_at = None
+        while True:
+            state = probe_page(driver, spec)
+            now = time.perf_counter()
+            if state in ("ready", "nodata", "error"):
+                outcome = state
+                break
+            if state == "loaded" and spec.optional:
+                # DOMは揃ったが要素が無い：表が無いこともあるページなので少しだけ待って打ち切る
+                loaded_at = loaded_at or now
+                if now - loaded_at >= spec.settle:
+                    outcome = "nodata"
+                    break
+            if now >= deadline:
+                outcome = "timeout"
+                break
+            time.sleep(self.poll_sec)
+        self.record(host, outcome, now - started_at, now - t_wait)
+        return outcome
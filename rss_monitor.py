@@ -0,0 +1,74 @@
+import os
+import resource
+import threading
+
+# ==================================================
+# RSS計測（自プロセス + 子孫プロセス = chromedriver / Chrome）
+# ==================================================
+
+def _read_rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"): return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def _children_map() -> dict:
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit(): continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # comm に空白や括弧が入ることがあるので最後の ")" 以降を読む
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+def process_tree_rss_mb(root_pid=None) -> float:
+    """ root_pid とその子孫のRSS合計(MB)。/proc が無い環境では自プロセスの最大RSSを返す """
+    root_pid = root_pid or os.getpid()
+    if not os.path.isdir("/proc"):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    children = _children_map()
+    total_kb, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total_kb += _read_rss_kb(pid)
+        stack.extend(children.get(pid, []))
+    return total_kb / 1024.0
+
+
+class PeakRssMonitor:
+    """ with PeakRssMonitor() as m: ... → m.peak_mb にプロセスツリーのピークRSS """
+
+    def __init__(self, interval=0.5, root_pid=None):
+        self.interval = interval
+        self.root_pid = root_pid
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self) -> float:
+        cur = process_tree_rss_mb(self.root_pid)
+        self.peak_mb = max(self.peak_mb, cur)
+        return cur
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._loop, name="rss-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        return False
@@ -0,0 +1,47 @@
+import re
+from functools import lru_cache
+
+# ==================================================
+# 全パーサ共通のテキスト正規化（プリコンパイル済み・メモ化）
+# ==================================================
+# セルごとに呼ばれるため、正規表現は使い回し、数値パースは結果をキャッシュする。
+# 馬番・着順・指数などの短いセルは値の種類が少ないのでキャッシュがよく当たる。
+
+_WS = re.compile(r"\s+")
+_NON_DIGIT = re.compile(r"\D")
+_NON_INT = re.compile(r"[^0-9\-]")
+
+# 全角数字・全角空白・全角マイナス類 → 半角
+_FW_TABLE = str.maketrans({
+    **{chr(0xFF10 + i): str(i) for i in range(10)},
+    "　": " ",
+    "－": "-", "−": "-", "‐": "-",
+})
+
+def clean_text_ja(s: str) -> str:
+    """ 連続空白（全角含む）を1つにまとめて前後を除去 """
+    if not s: return ""
+    return _WS.sub(" ", s).strip()
+
+@lru_cache(maxsize=4096)
+def digits_only(s: str) -> str:
+    """ 数字だけを半角で取り出す（"１２番" → "12"） """
+    if not s: return ""
+    return _NON_DIGIT.sub("", s.translate(_FW_TABLE))
+
+def digits_to_int(s: str, default=0) -> int:
+    d = digits_only(s)
+    return int(d) if d else default
+
+@lru_cache(maxsize=4096)
+def _parse_signed(s: str):
+    ss = _NON_INT.sub("", s.translate(_FW_TABLE))
+    if ss in {"", "-"}: return None
+    try: return int(ss)
+    except ValueError: return None
+
+def safe_int(s, default=0) -> int:
+    if s is None: return default
+    if isinstance(s, (int, float)): return int(s)
+    v = _parse_signed(str(s))
+    return default if v is None else v
@@ -0,0 +1,108 @@
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ==================================================
+# 出走表キャッシュの事前取得スケジューラ
+# ==================================================
+# calendar: [{"year": "2026", "kai": "04", "place": "04", "day": "07",
+#             "date": "2026-10-24", "races": [1, ..., 12]}, ...]
+#   date を指定した開催は、その日を過ぎると対象外になる。races 省略時は全12R。
+# times: ["06:30", "08:00"] のような1日の実行時刻（ローカル時刻）
+
+def _parse_times(times):
+    out = []
+    for t in times or []:
+        # 書式ミスは起動を止めずに読み飛ばす（app.py の読み込みごとに生成されるため）
+        try:
+            hh, mm = str(t).split(":")
+            out.append(datetime.time(int(hh), int(mm)))
+        except ValueError:
+            logger.warning("warmup: invalid time %r (expected HH:MM), skipped", t)
+    return sorted(out)
+
+def _card_races(card):
+    """ 開催の対象レース番号。不正な値があれば ValueError """
+    races = [int(r) for r in (card.get("races") or range(1, 13))]
+    bad = [r for r in races if not 1 <= r <= 12]
+    if bad: raise ValueError(f"invalid race numbers {bad}")
+    return races
+
+def next_run_at(times, now=None):
+    now = now or datetime.datetime.now()
+    for t in times:
+        cand = datetime.datetime.combine(now.date(), t)
+        if cand > now: return cand
+    return datetime.datetime.combine(now.date() + datetime.timedelta(days=1), times[0]) if times else None
+
+def upcoming_cards(calendar, today=None):
+    today = today or datetime.date.today()
+    cards = []
+    for c in calendar or []:
+        date_str = c.get("date")
+        try:
+            if date_str and datetime.date.fromisoformat(str(date_str)) < today: continue
+        except ValueError:
+            logger.warning("warmup: invalid date %r in calendar entry %r, skipped", date_str, c)
+            continue
+        cards.append(c)
+    return cards
+
+
+class WarmupScheduler:
+    """
+    指定時刻ごとに upcoming_cards の全レースを submit(card, race_num, mode) へ投入する。
+    実際の取得は共有ジョブキュー側で行うため、Chrome数は増えない。
+    """
+
+    def __init__(self, submit, calendar, times, prerun_ai=False):
+        self._submit = submit
+        self.calendar = calendar
+        self.times = _parse_times(times)
+        self.prerun_ai = prerun_ai
+        self.last_run_at = None
+        self.last_submitted = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not self.times or not self.calendar: return self
+        self._thread = threading.Thread(target=self._loop, name="cache-warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self) -> int:
+        modes = ["prefetch"] + (["ai"] if self.prerun_ai else [])
+        count, errors = 0, []
+        for card in upcoming_cards(self.calendar):
+            # 1開催の設定ミスで他の開催まで止めない（検証してから投入するので途中までの投入も起きない）
+            try:
+                races = _card_races(card)
+                for r in races:
+                    for mode in modes:
+                        self._submit(card, r, mode)
+                        count += 1
+            except Exception as e:
+                logger.exception("warmup: failed to submit card %r", card)
+                errors.append(f"{card.get('date') or card.get('day')}: {e}")
+        self.last_run_at = datetime.datetime.now()
+        self.last_submitted = count
+        self.last_error = " / ".join(errors) or None
+        return count
+
+    def _loop(self):
+        while not self._stop.is_set():
+            wait_sec = (next_run_at(self.times) - datetime.datetime.now()).total_seconds()
+            if self._stop.wait(max(wait_sec, 0)): break
+            # 例外でスレッドが死ぬと以後の事前取得が止まるので、記録して次の時刻を待つ
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.exception("warmup: run failed")
+                self.last_run_at, self.last_error = datetime.datetime.now(), str(e)